@@ -0,0 +1,163 @@
+"""Benchmark the scrapers against the local stand-in server, without touching the network.
+
+Each (mode, size) pair runs in a fresh process so peak memory is its own:
+
+    python benchmarks/run_benchmark.py --sizes 1000 10000 --latency 0.02 --forbidden-rate 0.01
+
+Modes:
+    direct  DirectRaciusScraper (direct_scraper.py) over plain HTTP
+    race    RaciusScraper (scraper.py), direct access raced against search;
+            needs Chrome, since searches go through the browser pool
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from array import array
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stand_in_server import serve  # noqa: E402
+
+# Pieces for synthetic company names; their product covers well over 1M names
+FIRST_WORDS = ['Construções', 'Transportes', 'Pastelaria', 'Auto', 'Sociedade', 'Comércio',
+               'Restaurante', 'Imobiliária', 'Farmácia', 'Têxteis', 'Serralharia', 'Café']
+SECOND_WORDS = ['Silva', 'Ferreira', 'Gonçalves', 'Sá & Filhos', 'Costa', 'Mendes', 'Araújo',
+                'Marques', 'do Norte', 'da Ribeira', 'São João', 'Oliveira']
+SUFFIXES = [', Lda', ' Lda.', ' - Unipessoal, Lda', ' Unipessoal Lda', ' S.A.', '']
+
+SIZES = [1000, 10000, 100000, 1000000]
+
+
+def synthetic_names(count):
+    """count distinct company names in the shapes the input file has"""
+    for i in range(count):
+        first = FIRST_WORDS[i % len(FIRST_WORDS)]
+        second = SECOND_WORDS[i // len(FIRST_WORDS) % len(SECOND_WORDS)]
+        suffix = SUFFIXES[i // (len(FIRST_WORDS) * len(SECOND_WORDS)) % len(SUFFIXES)]
+        number = i // (len(FIRST_WORDS) * len(SECOND_WORDS) * len(SUFFIXES))
+        yield f"{first} {second}{f' {number}' if number else ''}{suffix}"
+
+
+def build_scraper(mode, base_url, concurrency, backoff, browser_fallback):
+    from fetcher import FallbackFetcher, HttpFetcher, BrowserFetcher
+    from rate_limiter import HostRateLimiter
+    from throttle import AdaptiveThrottle
+    from direct_scraper import DirectRaciusScraper
+
+    host = base_url.split('://', 1)[1]
+    # Pace the stand-in only by the adaptive throttle, not by production rates
+    throttle = AdaptiveThrottle(
+        limiter=HostRateLimiter({host: (10000.0, concurrency)}),
+        breaker_hosts=(host,),
+        initial=concurrency, maximum=concurrency, base_backoff=backoff,
+    )
+    fetcher = HttpFetcher(pool_size=concurrency)
+
+    if mode == 'direct':
+        if browser_fallback:
+            fetcher = FallbackFetcher(fetcher, BrowserFetcher())
+        return DirectRaciusScraper(fetcher=fetcher, throttle=throttle, base_url=base_url)
+
+    from scraper import RaciusScraper
+    from driver_pool import DriverPool
+    pool = DriverPool()
+    if browser_fallback:
+        fetcher = FallbackFetcher(fetcher, BrowserFetcher(pool))
+    direct = DirectRaciusScraper(fetcher=fetcher, throttle=throttle, base_url=base_url)
+    return RaciusScraper(throttle=throttle, pool=pool, direct=direct, concurrency=concurrency,
+                         base_url=base_url, search_url=f"{base_url}/search")
+
+
+async def drive(scraper, names, concurrency, latencies, outcomes):
+    from company_record import result_label
+    from crawl import crawl
+
+    def timed_lookup(name):
+        start = time.perf_counter()
+        _, nif = scraper.lookup(name)
+        return time.perf_counter() - start, nif
+
+    async for elapsed, nif in crawl(names, timed_lookup, concurrency=concurrency):
+        latencies.append(elapsed)
+        outcomes[result_label(nif)] += 1
+
+
+def run_case(mode, size, base_url, options, results):
+    """Child process body: run one configuration and report its numbers"""
+    logging.basicConfig(level=logging.ERROR)
+    scraper = build_scraper(mode, base_url, options.concurrency, options.backoff, options.browser_fallback)
+    # Doubles, not Python floats, so a 1M run does not skew its own memory figure
+    latencies = array('d')
+    outcomes = Counter()
+    start = time.perf_counter()
+    try:
+        asyncio.run(drive(scraper, synthetic_names(size), options.concurrency, latencies, outcomes))
+    finally:
+        scraper.close()
+    wall = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    results.put({
+        'mode': mode,
+        'size': size,
+        'seconds': wall,
+        'per_second': size / wall if wall else 0.0,
+        'p50': ordered[len(ordered) // 2] if ordered else 0.0,
+        'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] if ordered else 0.0,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'found': outcomes['found'],
+        'not_found': outcomes['Not found'] + outcomes['Page not found'],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES[:2],
+                        help=f'numbers of synthetic companies to run (e.g. {" ".join(map(str, SIZES))})')
+    parser.add_argument('--modes', nargs='+', choices=['direct', 'race'], default=['direct'])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean added server latency, seconds')
+    parser.add_argument('--forbidden-rate', type=float, default=0.0, help='fraction of requests answered 403')
+    parser.add_argument('--captcha-rate', type=float, default=0.0, help='fraction of searches answered with a CAPTCHA')
+    parser.add_argument('--backoff', type=float, default=0.05, help='base backoff after a 403, seconds')
+    parser.add_argument('--browser-fallback', action='store_true',
+                        help='retry blocked pages in Chrome, as the scrapers do by default')
+    options = parser.parse_args()
+
+    # Fresh interpreters, so neither the server nor earlier runs share memory or metrics
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    server = context.Process(target=serve, daemon=True,
+                             args=(0, options.latency, options.forbidden_rate, options.captcha_rate, ready))
+    server.start()
+    base_url = f"http://127.0.0.1:{ready.get(timeout=30)}"
+
+    print(f"{'mode':<8}{'companies':>10}{'seconds':>10}{'per sec':>10}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'peak MB':>10}{'found':>10}")
+    try:
+        for mode, size in itertools.product(options.modes, options.sizes):
+            results = context.Queue()
+            case = context.Process(target=run_case, args=(mode, size, base_url, options, results))
+            case.start()
+            case.join()
+            if case.exitcode:
+                print(f"{mode:<8}{size:>10}  failed (exit code {case.exitcode})")
+                continue
+            result = results.get()
+            print(f"{mode:<8}{size:>10}{result['seconds']:>10.1f}{result['per_second']:>10.1f}"
+                  f"{result['p50'] * 1000:>10.1f}{result['p99'] * 1000:>10.1f}"
+                  f"{result['peak_rss_mb']:>10.1f}{result['found']:>10}")
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
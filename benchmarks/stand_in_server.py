@@ -0,0 +1,151 @@
+"""Local stand-in for racius.com and Google search, serving recorded fixtures.
+
+Which companies exist, under which slug and with which NIF is derived from a
+hash of the slug, so any synthetic name list gets consistent answers without
+the server holding a registry. Latency, 403s and CAPTCHA pages can be injected.
+
+    python benchmarks/stand_in_server.py --port 8765 --latency 0.05 --forbidden-rate 0.01
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from string import Template
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from normalization import slugify  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# The NIF formats extract_nif has to cope with, one fixture each
+COMPANY_FIXTURES = ['company_data_nif', 'company_class_nif', 'company_label', 'company_contribuinte']
+
+
+def load_fixtures():
+    fixtures = {}
+    for filename in os.listdir(FIXTURES_DIR):
+        if filename.endswith('.html'):
+            with open(os.path.join(FIXTURES_DIR, filename), encoding='utf-8') as f:
+                fixtures[filename[:-5]] = Template(f.read())
+    return fixtures
+
+
+def nif_for(key):
+    """A NIF with a valid check digit, stable for a given company"""
+    digits = '5' + str(zlib.crc32(key.encode()) % 10 ** 7).zfill(7)
+    total = sum(int(digit) * weight for digit, weight in zip(digits, range(9, 1, -1)))
+    remainder = total % 11
+    return digits + str(0 if remainder < 2 else 11 - remainder)
+
+
+def registry_entry(slug):
+    """(canonical slug, NIF) for the company behind slug, or None if it does not exist.
+
+    One company in ten is missing, two in ten are registered without the -lda
+    suffix (exercising the second slug variant) and the rest with it.
+    """
+    base = slug[:-4] if slug.endswith('-lda') else slug
+    bucket = zlib.crc32(base.encode()) % 10
+    if bucket == 0:
+        return None
+    canonical = base if bucket in (1, 2) else f'{base}-lda'
+    if slug != canonical:
+        return None
+    return canonical, nif_for(base)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_html(self, status, body, etag=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        config = self.server.config
+        if config.latency:
+            time.sleep(random.uniform(0, 2 * config.latency))
+        if random.random() < config.forbidden_rate:
+            self.send_html(403, '<html><body>403 Forbidden</body></html>')
+            return
+
+        fixtures = self.server.fixtures
+        url = urlparse(self.path)
+        if url.path == '/search':
+            self.serve_search(fixtures, parse_qs(url.query).get('q', [''])[0])
+        else:
+            self.serve_company(fixtures, url.path.strip('/'))
+
+    def serve_search(self, fixtures, query):
+        if random.random() < self.server.config.captcha_rate:
+            self.send_html(200, fixtures['captcha'].substitute())
+            return
+        name = query.split(' ', 1)[1] if ' ' in query else query
+        entry = registry_entry(slugify(name, keep_lda=True)) or registry_entry(slugify(name))
+        slug = entry[0] if entry else slugify(name)
+        base = f'http://{self.headers.get("Host")}'
+        self.send_html(200, fixtures['serp'].substitute(query=query, name=name, slug=slug, base=base))
+
+    def serve_company(self, fixtures, slug):
+        entry = registry_entry(slug) if slug and '/' not in slug else None
+        if entry is None:
+            self.send_html(404, fixtures['not_found'].substitute())
+            return
+        canonical, nif = entry
+        # Company pages never change here, so the NIF doubles as their ETag
+        etag = f'"{nif}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        fixture = COMPANY_FIXTURES[zlib.crc32(canonical.encode()) % len(COMPANY_FIXTURES)]
+        name = canonical.replace('-', ' ').title()
+        self.send_html(200, fixtures[fixture].substitute(name=name, nif=nif), etag)
+
+
+def make_server(host='127.0.0.1', port=0, latency=0.0, forbidden_rate=0.0, captcha_rate=0.0):
+    server = ThreadingHTTPServer((host, port), StandInHandler)
+    server.daemon_threads = True
+    server.fixtures = load_fixtures()
+    server.config = argparse.Namespace(latency=latency, forbidden_rate=forbidden_rate,
+                                       captcha_rate=captcha_rate)
+    return server
+
+
+def serve(port, latency, forbidden_rate, captcha_rate, ready=None):
+    server = make_server(port=port, latency=latency, forbidden_rate=forbidden_rate,
+                         captcha_rate=captcha_rate)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean added latency per request, seconds')
+    parser.add_argument('--forbidden-rate', type=float, default=0.0, help='fraction of requests answered 403')
+    parser.add_argument('--captcha-rate', type=float, default=0.0, help='fraction of searches answered with a CAPTCHA')
+    args = parser.parse_args()
+    print(f"Serving stand-in racius.com on http://127.0.0.1:{args.port}/ (search at /search)")
+    serve(args.port, args.latency, args.forbidden_rate, args.captcha_rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import csv
+
+import pandas as pd
+
+RESULT_COLUMNS = ['company_name', 'nif']
+
+
+def read_companies(path, chunksize=10000):
+    """Yield company names from a headerless one-column CSV, one chunk in memory at a time"""
+    # utf-8-sig drops the BOM our exported lists start with
+    reader = pd.read_csv(path, header=None, names=['company_name'], encoding='utf-8-sig',
+                         dtype=str, keep_default_na=False, chunksize=chunksize)
+    for chunk in reader:
+        yield from chunk['company_name']
+
+
+def read_results(path, chunksize=10000):
+    """Yield earlier output rows as dicts, from CSV or Parquet, one chunk in memory at a time"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield from batch.to_pylist()
+        return
+    reader = pd.read_csv(path, encoding='utf-8-sig', dtype=str, keep_default_na=False, chunksize=chunksize)
+    for chunk in reader:
+        for row in chunk.to_dict('records'):
+            # Empty CSV cells stand for missing values, as they do in Parquet
+            yield {column: value if value != '' else None for column, value in row.items()}
+
+
+class CsvResultWriter:
+    """Writes result rows to CSV as they arrive"""
+
+    def __init__(self, path, columns=RESULT_COLUMNS, flush_every=100):
+        self.path = path
+        self.flush_every = flush_every
+        self.pending = 0
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, *row):
+        self.writer.writerow(row)
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self.file.flush()
+            self.pending = 0
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetResultWriter:
+    """Writes result rows to Parquet in fixed-size row groups"""
+
+    def __init__(self, path, columns=RESULT_COLUMNS, batch_size=50000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.path = path
+        self.columns = columns
+        self.batch_size = batch_size
+        self.schema = pa.schema([(column, pa.string()) for column in columns])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.rows = []
+
+    def write(self, *row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        arrays = [self.pa.array([row[i] for row in self.rows], type=self.pa.string())
+                  for i in range(len(self.columns))]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def open_writer(path, columns=RESULT_COLUMNS, format=None):
+    """Pick the writer from format ('csv' or 'parquet'), or else from the file extension"""
+    if format == 'parquet' or (format is None and path.endswith('.parquet')):
+        return ParquetResultWriter(path, columns)
+    return CsvResultWriter(path, columns)
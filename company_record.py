@@ -0,0 +1,125 @@
+import re
+from dataclasses import dataclass, fields as dataclass_fields
+
+from metrics import METRICS
+
+# Value shapes shared by the field patterns below
+TEXT_VALUE = r'(?P<{name}>[^\s<>:][^<>]*?)\s*(?=<)'
+DATE_VALUE = r'(?P<{name}>\d{{2}}[-/.]\d{{2}}[-/.]\d{{4}}|\d{{4}}-\d{{2}}-\d{{2}})'
+
+# name -> (label regex, value regex). Labels are whole words, followed by a colon
+# and/or the few tags of a label/value pair (<dt>Morada</dt><dd>...).
+FIELD_PATTERNS = {
+    'address': (r'\b(?:Morada|Sede)\b', TEXT_VALUE),
+    'cae': (r'\bCAE(?:\s+principal)?(?:\s+Rev\.?\s*\d)?\b', r'(?P<{name}>\d{{5}})(?!\d)'),
+    'status': (r'\b(?:Estado|Situação)\b', TEXT_VALUE),
+    'capital': (r'\bCapital(?:\s+social)?\b', r'(?P<{name}>\d[\d.\s]*(?:,\d{{1,2}})?)'),
+    'founded': (r'\b(?:Data\s+de\s+(?:constituição|início(?:\s+de\s+atividade)?)|Constituição|Fundada\s+em)\b', DATE_VALUE),
+}
+# Labels that read as prose, with the value straight after them and no colon
+# or tag in between ("Fundada em 12-03-2001"); tried alongside the labels above
+INLINE_LABELS = {
+    'founded': r'\bFundada\s+em\s+',
+}
+DEFAULT_FIELDS = tuple(FIELD_PATTERNS)
+
+# What CompanyRecord.nif holds instead of a NIF when a lookup fails
+FAILURE_MARKERS = ("Not found", "Page not found", "Error", "Blocked")
+# Failures of the request rather than answers from the site (a timeout, a page
+# blocked over every fetcher); such rows are never final and are looked up again
+RETRY_MARKERS = ("Error", "Blocked")
+
+# Only the tags that pair a label with its value may sit between them, at most
+# three (</dt><dd>, </td><td><span>), so a label word in a menu or in prose
+# never picks up whatever text happens to follow it further down the page
+PAIR_TAG = r'</?(?:dt|dd|th|td|span|strong|b|label)\b[^>]*>'
+SEPARATOR = rf'(?=\s*[:<])\s*:?\s*(?:{PAIR_TAG}\s*){{0,3}}:?\s*'
+
+
+@dataclass(slots=True)
+class CompanyRecord:
+    """What one company page yields; nif holds the NIF or a failure marker"""
+    nif: str
+    address: str | None = None
+    cae: str | None = None
+    status: str | None = None
+    capital: str | None = None
+    founded: str | None = None
+
+    def values(self, fields):
+        return tuple(getattr(self, field) for field in fields)
+
+    def extra(self):
+        """Every field besides the NIF that has a value"""
+        return {field.name: getattr(self, field.name) for field in dataclass_fields(self)
+                if field.name != 'nif' and getattr(self, field.name) is not None}
+
+
+def result_label(nif):
+    """The failure marker, or 'found' for a NIF; the key results are tallied under"""
+    return nif if nif in FAILURE_MARKERS else "found"
+
+
+def _clean_capital(value):
+    """'1.234.567,50' -> '1234567.50'"""
+    whole, _, cents = re.sub(r'[.\s]', '', value).partition(',')
+    return f"{whole}.{cents.ljust(2, '0')}" if cents else whole
+
+
+def _clean_date(value):
+    """dd-mm-yyyy in any separator -> yyyy-mm-dd"""
+    if value[4] == '-':
+        return value
+    day, month, year = re.split(r'[-/.]', value)
+    return f"{year}-{month}-{day}"
+
+
+CLEANERS = {
+    'address': lambda value: ' '.join(value.split()),
+    'status': lambda value: ' '.join(value.split()),
+    'capital': _clean_capital,
+    'founded': _clean_date,
+}
+
+
+class RecordExtractor:
+    """Pulls the requested company fields out of a page in one pass.
+
+    The field patterns are compiled into a single alternation with a named
+    group per field; the first hit for each field wins. Fields not asked for
+    are not compiled in and stay None.
+    """
+
+    def __init__(self, fields=DEFAULT_FIELDS):
+        unknown = set(fields) - set(FIELD_PATTERNS)
+        if unknown:
+            raise ValueError(f"Unknown record fields: {', '.join(sorted(unknown))}")
+        self.fields = tuple(fields)
+        self.regex = re.compile('|'.join(
+            self.label(field) + FIELD_PATTERNS[field][1].format(name=field)
+            for field in self.fields
+        ), re.IGNORECASE) if self.fields else None
+
+    @staticmethod
+    def label(field):
+        """Regex for the label of field and whatever separates it from the value"""
+        label = FIELD_PATTERNS[field][0] + SEPARATOR
+        if field in INLINE_LABELS:
+            return f'(?:{label}|{INLINE_LABELS[field]})'
+        return label
+
+    def extract(self, text):
+        """{field: value} for every requested field found in text"""
+        found = {}
+        if self.regex is None:
+            return found
+        with METRICS.timer('record_extraction'):
+            for match in self.regex.finditer(text):
+                field = match.lastgroup
+                if field not in found:
+                    found[field] = CLEANERS.get(field, str)(match.group(field))
+                    if len(found) == len(self.fields):
+                        break
+        for field in self.fields:
+            METRICS.inc('record_fields_total', field=field, result='hit' if field in found else 'miss')
+        return found
@@ -0,0 +1,52 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# How many submitted items may wait behind the slowest in-flight one
+WINDOW_FACTOR = 4
+
+
+async def crawl(items, worker, concurrency=8):
+    """Run worker(item) for every item with up to `concurrency` calls in flight.
+
+    Workers are blocking callables (HTTP or WebDriver calls) and run on a thread
+    pool; politeness is left to the throttle they use. Results are yielded in
+    input order, and only a bounded window of items is read ahead of the output.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    window = concurrency * WINDOW_FACTOR
+    pending = deque()
+
+    try:
+        for item in items:
+            pending.append(loop.run_in_executor(executor, worker, item))
+            if len(pending) >= window:
+                yield await pending.popleft()
+
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def crawl_sync(items, worker, concurrency=8):
+    """crawl() for callers without an event loop: a plain iterator with the same ordering and window"""
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    window = concurrency * WINDOW_FACTOR
+    pending = deque()
+
+    try:
+        for item in items:
+            pending.append(executor.submit(worker, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
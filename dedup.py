@@ -0,0 +1,88 @@
+import logging
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from normalization import company_key
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Results kept without counts: duplicates further apart than this are looked up again
+KEEP_RECENT = 10000
+
+
+@dataclass
+class DuplicateReport:
+    rows: int
+    distinct: int
+    # Rows left per key, only for keys that occur more than once
+    counts: Counter
+
+    @property
+    def ratio(self):
+        """Fraction of rows that need no lookup of their own"""
+        return (self.rows - self.distinct) / self.rows if self.rows else 0.0
+
+
+def find_duplicates(names):
+    """One pass over the input, grouping names by canonical company key"""
+    counts = Counter(company_key(name) for name in names)
+    rows = sum(counts.values())
+    report = DuplicateReport(rows, len(counts), Counter({key: n for key, n in counts.items() if n > 1}))
+    logger.info("%s companies, %s distinct (%.1f%% duplicates)", report.rows, report.distinct, 100 * report.ratio)
+    return report
+
+
+class Coalescer:
+    """Resolves each canonical company key once and shares the result with every row carrying it.
+
+    Rows with the same key (suffix forms, case, accents) would request the same
+    URLs, so only the first goes to the network; the rest wait for its answer,
+    even while it is still in flight. With counts from find_duplicates() a
+    result is dropped once its last row has been served; without them only
+    the `keep` most recently used results are held on to.
+    """
+
+    def __init__(self, lookup, counts=None, keep=KEEP_RECENT):
+        self.lookup_fn = lookup
+        self.counts = counts
+        self.keep = keep
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _claim(self, key):
+        """(future for key, whether this caller has to resolve it)"""
+        with self.lock:
+            future = self.results.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                if self.counts is None or key in self.counts:
+                    self.results[key] = future
+                if self.counts is None and len(self.results) > self.keep:
+                    self.results.popitem(last=False)
+            elif self.counts is None:
+                self.results.move_to_end(key)
+            if self.counts is not None and key in self.counts:
+                self.counts[key] -= 1
+                if not self.counts[key]:
+                    del self.counts[key]
+                    del self.results[key]
+            return future, owner
+
+    def lookup(self, company_name):
+        """Same contract as the wrapped lookup: (company_name, result)"""
+        future, owner = self._claim(company_key(company_name))
+        if not owner:
+            METRICS.inc('coalesced_lookups_total')
+            return company_name, future.result()
+
+        try:
+            _, result = self.lookup_fn(company_name)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return company_name, result
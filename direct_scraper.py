@@ -1,200 +1,350 @@
 import os
-import time
-import random
-import pandas as pd
-import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import re
-from tqdm import tqdm
+import argparse
+import logging
+import asyncio
+import itertools
+from collections import Counter
+from fetcher import default_fetcher
+from throttle import AdaptiveThrottle, CANCELLED
+from crawl import crawl
+from journal import CheckpointJournal
+from lookup_cache import LookupCache
+from company_io import read_results, open_writer, RESULT_COLUMNS
+from company_record import CompanyRecord, RecordExtractor, result_label
+from refresh import Refresher, DAY
+from nif_extractor import NifExtractor
+from slug_index import SlugIndex, company_slug
+from normalization import slug_variants, fuzzy_key
+from page_parser import page_company_name
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Most lookups kept in flight at once
+CONCURRENCY = 16
+
+NIF_EXTRACTOR = NifExtractor()
+
+INPUT_PATH = 'empresas_lda_com_nif.csv'
+OUTPUT_PATH = 'companies_with_nifs.csv'
+CACHE_PATH = 'racius_cache.sqlite'
+JOURNAL_PATH = 'companies_with_nifs_progress.jsonl'
+# Journal of a refresh run; removed once the refreshed output replaces the old one
+REFRESH_JOURNAL_PATH = 'companies_with_nifs_refresh.jsonl'
+# Rows with a NIF are revalidated in refresh mode once their page is this old
+REFRESH_MAX_AGE_DAYS = 30
+# Prometheus text format if the name ends in .prom, JSON summary otherwise
+METRICS_PATH = 'scrape_metrics.json'
+
+# Per-company chatter is logged at DEBUG; set NIF_SCRAPER_LOG_LEVEL=DEBUG to see it
+LOG_LEVEL = os.environ.get('NIF_SCRAPER_LOG_LEVEL', 'INFO').upper()
+PROGRESS_EVERY = 100
+# Saved slug index, built from the sitemap files in SITEMAP_DIR on first use
+SLUG_INDEX_PATH = 'racius_slug_index.pickle'
+SITEMAP_DIR = 'sitemaps'
+# Company fields to extract alongside the NIF from the same page, written as
+# extra output columns; any of company_record.FIELD_PATTERNS, e.g. DEFAULT_FIELDS
+RECORD_FIELDS = ()
 
 class DirectRaciusScraper:
-    def __init__(self):
-        self.base_url = "https://www.racius.com"
-        self.setup_driver()
-        
-    def setup_driver(self):
-        options = uc.ChromeOptions()
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--window-size=1920,1080')
-        
-        try:
-            self.driver = uc.Chrome(options=options)
-            self.driver.set_page_load_timeout(30)
-        except Exception as e:
-            print(f"Error setting up Chrome driver: {str(e)}")
-            raise
-            
-    def random_sleep(self, min_time=2, max_time=4):
-        time.sleep(random.uniform(min_time, max_time))
+    def __init__(self, fetcher=None, throttle=None, cache=None, index=None, fields=(),
+                 base_url="https://www.racius.com"):
+        self.base_url = base_url
+        # Plain HTTP by default, Chrome only when racius.com blocks the request
+        self.fetcher = fetcher or default_fetcher()
+        # Politeness towards racius.com adapts to how the site is responding
+        self.throttle = throttle or AdaptiveThrottle()
+        # Optional LookupCache; slugs answered there never touch the network
+        self.cache = cache
+        # Optional SlugIndex built from racius.com sitemaps
+        self.index = index
+        # Other company fields read from the page the NIF comes from
+        self.records = RecordExtractor(fields)
         
     def normalize_company_name(self, name):
-        """Convert company name to URL-friendly format"""
-        # First try with Lda
-        name_with_lda = self._normalize_name(name, keep_lda=True)
-        name_without_lda = self._normalize_name(name, keep_lda=False)
-        return [name_with_lda, name_without_lda]
-        
-    def _normalize_name(self, name, keep_lda=False):
-        """Helper function to normalize names with option to keep or remove Lda"""
-        # Convert to lowercase
-        name = name.lower().strip()
-        
-        # Handle special company types
-        if keep_lda:
-            # Just clean up the Lda format
-            name = re.sub(r',?\s*unipessoal\s*lda\.?', '-lda', name, flags=re.IGNORECASE)
-            name = re.sub(r',?\s*lda\.?', '-lda', name, flags=re.IGNORECASE)
-        else:
-            # Remove company types completely
-            name = re.sub(r',?\s*unipessoal\s*lda\.?', '', name, flags=re.IGNORECASE)
-            name = re.sub(r',?\s*lda\.?', '', name, flags=re.IGNORECASE)
+        """Convert company name to URL-friendly format, with and without Lda"""
+        return slug_variants(name)
         
-        # Replace special characters
-        chars_map = {
-            'ç': 'c', 'ã': 'a', 'á': 'a', 'à': 'a', 'â': 'a',
-            'é': 'e', 'ê': 'e', 'í': 'i', 'ó': 'o', 'õ': 'o',
-            'ô': 'o', 'ú': 'u', 'ü': 'u', 'ñ': 'n'
-        }
-        for old, new in chars_map.items():
-            name = name.replace(old, new)
+    def resolve_slugs(self, company_name):
+        """(slugs worth requesting, best first; the one whose page must name the company, or None)"""
+        with METRICS.timer('slug_resolve'):
+            # Both with and without Lda in the URL
+            slugs = self.normalize_company_name(company_name)
+            if self.index is None:
+                return slugs, None
+            
+            # The sitemap index knows the canonical URL, or that there is none
+            url, match = self.index.resolve(company_name, slugs)
+        METRICS.inc('slug_index_matches_total', match=match or 'none')
+        if url is None:
+            logger.debug("No slug index candidate for %s", company_name)
+            return [], None
+        slug = company_slug(url)
+        if match == 'ngram':
+            # Only a similar name, possibly another company's: its page is checked
+            # before it is believed, and the slugs derived from the name come after it
+            logger.debug("Slug index has only a similar name for %s: %s", company_name, slug)
+            return [slug] + [variant for variant in slugs if variant != slug], slug
+        return [slug], None
         
-        # Handle special characters and spaces
-        name = re.sub(r'[&+]', 'e', name)  # Replace & and + with 'e'
-        name = re.sub(r'[^a-z0-9]+', '-', name)  # Replace any non-alphanumeric chars with single hyphen
-        name = name.strip('-')  # Remove leading/trailing hyphens
+    def candidate_slugs(self, company_name):
+        """Slugs worth requesting, best first"""
+        return self.resolve_slugs(company_name)[0]
         
-        return name
+    def names_company(self, company_name, result):
+        """Whether the fetched page is about company_name and not a namesake"""
+        page_name = page_company_name(result.text)
+        return page_name is not None and fuzzy_key(page_name) == fuzzy_key(company_name)
         
-    def access_company_page(self, company_name):
+    def access_company_page(self, company_name, slugs=None, revalidate=False, started=None, cancel=None,
+                            unverified=None):
+        """Return (slug, FetchResult) for the company page, or (None, failure marker).
+
+        The marker is "Page not found" when every URL variant is missing, and
+        "Blocked" or "Error" when some variant could not be read at all, so the
+        company is tried again later. With revalidate, cached misses are tried
+        again and cached pages are requested conditionally, so an unchanged page
+        comes back as a bodiless 304. started, if given, is set once the throttle
+        lets the first request go out; once cancel is set no further variant or
+        browser fallback is tried. The page of the unverified slug is only
+        accepted if it names the company.
+        """
+        failure = "Page not found"
         try:
-            # Try both with and without Lda in the URL
-            normalized_names = self.normalize_company_name(company_name)
+            normalized_names = self.candidate_slugs(company_name) if slugs is None else slugs
             
             for normalized_name in normalized_names:
+                if cancel is not None and cancel.is_set():
+                    logger.debug("Lookup cancelled, not trying further URLs")
+                    return None, failure
                 url = f"{self.base_url}/{normalized_name}/"
-                print(f"Trying URL: {url}")
                 
-                self.driver.get(url)
-                self.random_sleep(1, 2)
+                # Skip variants already known to be missing
+                validators = None
+                if self.cache and not revalidate:
+                    entry = self.cache.get(normalized_name)
+                    if entry is not None and not entry.page_found:
+                        logger.debug("Cached miss, skipping URL: %s", url)
+                        continue
+                elif self.cache and normalized_name != unverified:
+                    entry = self.cache.entry(normalized_name)
+                    if entry is not None and entry.page_found and self.has_fields(entry):
+                        validators = entry.validators or None
+                
+                logger.debug("Trying URL: %s", url)
+                
+                try:
+                    with self.throttle.slot(url) as slot:
+                        if cancel is not None and cancel.is_set():
+                            slot.record(CANCELLED)
+                            return None, failure
+                        if started is not None:
+                            started.set()
+                        with METRICS.timer('page_fetch'):
+                            result = self.fetcher.fetch(url, validators, cancel)
+                        # A page the fallback got through is still a block the throttle has to back off from
+                        slot.record((result.primary or result).outcome)
+                except Exception as e:
+                    # A timeout or dropped connection says nothing about whether the page exists
+                    logger.warning("Error fetching %s: %s", url, e)
+                    METRICS.inc('page_fetches_total', via='error', outcome='error')
+                    failure = "Error"
+                    continue
+                if result.primary is not None:
+                    METRICS.inc('page_fetches_total', via=result.primary.via, outcome=result.primary.outcome)
+                METRICS.inc('page_fetches_total', via=result.via, outcome=result.outcome)
+                
+                if result.blocked:
+                    logger.debug("Blocked on every fetcher, trying alternative URL...")
+                    failure = "Blocked"
+                    continue
                 
                 # Check if page exists
-                if "Página não encontrada" not in self.driver.page_source:
-                    print("Page found successfully")
-                    return True
+                if not result.not_found:
+                    if normalized_name == unverified:
+                        accepted = self.names_company(company_name, result)
+                        METRICS.inc('slug_index_checks_total', result='accepted' if accepted else 'rejected')
+                        if not accepted:
+                            logger.debug("%s is another company's page, trying alternative URL...", url)
+                            continue
+                    logger.debug("Page found successfully (via %s)", result.via)
+                    return normalized_name, result
+                
+                if self.cache:
+                    self.cache.put(normalized_name, url, None, 404)
                     
-                print("Page not found, trying alternative URL...")
+                logger.debug("Page not found, trying alternative URL...")
             
-            print("All URL variations failed")
-            return False
+            logger.debug("All URL variations failed")
+            return None, failure
             
         except Exception as e:
-            print(f"Error accessing company page: {str(e)}")
-            return False
+            logger.warning("Error accessing company page: %s", e)
+            return None, "Error"
             
-    def extract_nif(self):
+    def extract_nif(self, page_source):
         try:
-            # Wait for page content to load
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
+            # Single pass over the page; candidates failing the check digit are dropped
+            with METRICS.timer('extraction'):
+                match = NIF_EXTRACTOR.extract(page_source)
+            if match:
+                logger.debug("Found NIF: %s (pattern %s)", match.nif, match.pattern)
+                return match
             
-            # Get the page source
-            page_source = self.driver.page_source
-            
-            # Try various NIF patterns
-            nif_patterns = [
-                r'NIF:\s*(\d{9})',
-                r'NIF\s+(\d{9})',
-                r'NIF[^0-9]*(\d{9})',
-                r'data-nif="(\d{9})"',
-                r'class="nif"[^>]*>(\d{9})<',
-                r'>NIF:\s*(\d{9})<',
-                r'>Nº Contribuinte:\s*(\d{9})<',
-                r'contribuinte[^>]*>(\d{9})<'
-            ]
-            
-            for pattern in nif_patterns:
-                match = re.search(pattern, page_source)
-                if match:
-                    nif = match.group(1)
-                    print(f"Found NIF: {nif}")
-                    return nif
-            
-            print("No NIF found")
+            logger.debug("No NIF found")
             return None
             
         except Exception as e:
-            print(f"Error extracting NIF: {str(e)}")
+            logger.warning("Error extracting NIF: %s", e)
             return None
             
+    def has_fields(self, entry):
+        """Whether a cached page was read for every record field now asked for"""
+        return set(self.records.fields) <= set(entry.record or ())
+        
+    def record_from(self, nif, entry):
+        extra = (entry.record if entry is not None else None) or {}
+        return CompanyRecord(nif, **{field: extra.get(field) for field in self.records.fields})
+        
+    def cached_record(self, slugs):
+        """The CompanyRecord the cache alone can answer with, or None"""
+        cached, entry = self.cache.resolve_entry(slugs)
+        if cached is None:
+            return None
+        if entry is not None and not self.has_fields(entry):
+            # Cached before these fields were asked for; the page has to be read again
+            return None
+        return self.record_from(cached, entry)
+        
+    def lookup_record(self, company_name, revalidate=False, started=None, cancel=None):
+        """Resolve one company to (company_name, CompanyRecord) from a single page visit.
+
+        revalidate skips cached answers and checks the site again, conditionally
+        where the cache holds validators for the page. started and cancel are
+        passed on to access_company_page.
+        """
+        slugs, unverified = self.resolve_slugs(company_name)
+        if self.cache and not revalidate:
+            # What the cache holds for a merely similar slug is not known to be this company
+            cached = self.cached_record([slug for slug in slugs if slug != unverified])
+            METRICS.inc('cache_lookups_total', result='miss' if cached is None else 'hit')
+            if cached is not None:
+                logger.debug("Cache hit for %s: %s", company_name, cached.nif)
+                return company_name, cached
+        
+        slug, result = self.access_company_page(company_name, slugs, revalidate, started, cancel, unverified)
+        if slug is None:
+            # result is the failure marker
+            return company_name, CompanyRecord(result)
+        
+        if result.unchanged:
+            # Same page as last time; the cached record stands without re-parsing
+            logger.debug("Page unchanged since last visit: %s", result.url)
+            METRICS.inc('unchanged_pages_total')
+            entry = self.cache.entry(slug)
+            self.cache.touch(slug)
+            return company_name, self.record_from(entry.nif or "Not found", entry)
+        
+        match = self.extract_nif(result.text)
+        nif = match.nif if match else None
+        record = CompanyRecord(nif or "Not found", **self.records.extract(result.text))
+        if self.cache:
+            # Fields looked for but missing are stored too, so the cache knows they were asked for
+            fields = self.records.fields
+            self.cache.put(slug, result.url, nif, result.status, dict(zip(fields, record.values(fields))),
+                           result.etag, result.last_modified)
+        return company_name, record
+        
+    def lookup(self, company_name, started=None, cancel=None):
+        """Resolve one company to (company_name, nif or failure marker)"""
+        _, record = self.lookup_record(company_name, started=started, cancel=cancel)
+        return company_name, record.nif
+            
     def close(self):
-        if self.driver:
-            print("Closing browser...")
-            self.driver.quit()
+        if self.fetcher:
+            self.fetcher.close()
+        if self.cache:
+            self.cache.close()
 
-def main():
-    # Read the CSV file
-    df = pd.read_csv('empresas_lda_com_nif.csv', header=None, names=['company_name'])
-    companies = df['company_name'].tolist()
+async def process_companies(lookup, companies, journal, writer, summary, fields=RECORD_FIELDS):
+    async for company, record in crawl(companies, lookup, concurrency=CONCURRENCY):
+        nif = record.nif
+        summary['processed'] += 1
+        summary[result_label(nif)] += 1
+        METRICS.inc('companies_total', result=result_label(nif))
+        logger.debug("Processed company %s: %s -> %s", summary['processed'], company, nif)
+        if summary['processed'] % PROGRESS_EVERY == 0:
+            logger.info("Processed %s companies (%s NIFs found)", summary['processed'], summary['found'])
+        # One journal line per finished company, then straight to the output file
+        journal.record(company, nif, record.extra())
+        writer.write(company, *record.values(('nif',) + fields))
+
+def refresh(max_age_days=REFRESH_MAX_AGE_DAYS):
+    """Rewrite OUTPUT_PATH, looking up again only the rows that are failed or stale"""
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if not os.path.exists(OUTPUT_PATH):
+        raise SystemExit(f"Nothing to refresh: {OUTPUT_PATH} does not exist")
     
-    # Initialize results dictionary
-    results = {'company_name': [], 'nif': []}
+    # The old output is read while the new one is written next to it
+    journal = CheckpointJournal(REFRESH_JOURNAL_PATH)
+    done = journal.load()
+    if done:
+        logger.info("Resuming refresh: %s rows already in %s", done, REFRESH_JOURNAL_PATH)
+        journal.check((row['company_name'] for row in read_results(OUTPUT_PATH)), OUTPUT_PATH)
+    refreshed_path = OUTPUT_PATH + '.refresh'
+    if OUTPUT_PATH.endswith('.parquet'):
+        refreshed_path = OUTPUT_PATH[:-len('.parquet')] + '.refresh.parquet'
+    writer = open_writer(refreshed_path, RESULT_COLUMNS + list(RECORD_FIELDS))
+    summary = Counter()
+    for company, nif, *extra in journal.entries(RECORD_FIELDS):
+        writer.write(company, nif, *extra)
+        summary[result_label(nif)] += 1
+    summary['processed'] = done
     
-    # Initialize scraper
-    scraper = DirectRaciusScraper()
+    rows = itertools.islice(read_results(OUTPUT_PATH), done, None)
+    index = SlugIndex.load_or_build(SLUG_INDEX_PATH, SITEMAP_DIR)
+    scraper = DirectRaciusScraper(cache=LookupCache(CACHE_PATH), index=index, fields=RECORD_FIELDS)
+    refresher = Refresher(scraper, RECORD_FIELDS, max_age=max_age_days * DAY)
     
+    finished = False
     try:
-        # Process each company
-        for i, company in enumerate(companies, 1):
-            print(f"\nProcessing company {i}/{len(companies)}: {company}")
-            
-            if scraper.access_company_page(company):
-                nif = scraper.extract_nif()
-                if nif:
-                    results['company_name'].append(company)
-                    results['nif'].append(nif)
-                else:
-                    results['company_name'].append(company)
-                    results['nif'].append("Not found")
-            else:
-                results['company_name'].append(company)
-                results['nif'].append("Page not found")
-            
-            # Save progress every 5 companies
-            if i % 5 == 0:
-                temp_df = pd.DataFrame(results)
-                temp_df.to_csv('companies_with_nifs_progress.csv', index=False)
-                print(f"Progress saved. Processed {i}/{len(companies)} companies")
-            
-            # Random delay between requests
-            time.sleep(random.uniform(1, 2))
-            
+        asyncio.run(process_companies(refresher.lookup, rows, journal, writer, summary))
+        finished = True
     finally:
-        # Close the browser
         scraper.close()
-        
-        # Save final results
-        print("\nSaving final results...")
-        results_df = pd.DataFrame(results)
-        results_df.to_csv('companies_with_nifs.csv', index=False)
-        
-        # Print summary
-        successful_nifs = len([nif for nif in results['nif'] if nif not in ["Not found", "Page not found"]])
-        not_found = len([nif for nif in results['nif'] if nif == "Not found"])
-        page_not_found = len([nif for nif in results['nif'] if nif == "Page not found"])
-        
-        print(f"\n--- Scraping Summary ---")
-        print(f"Total companies processed: {len(companies)}")
-        print(f"Successfully found NIFs: {successful_nifs}")
-        print(f"NIFs not found on page: {not_found}")
-        print(f"Pages not found: {page_not_found}")
-        print(f"Results saved to companies_with_nifs.csv")
-        print(f"--- End Summary ---")
+        journal.close()
+        writer.close()
+        METRICS.write(METRICS_PATH)
+    
+    # Only a complete refresh replaces the old output; an interrupted one resumes from its journal
+    if finished:
+        os.replace(refreshed_path, OUTPUT_PATH)
+        os.remove(REFRESH_JOURNAL_PATH)
+    
+    print(f"\n--- Refresh Summary ---")
+    print(f"Total companies: {summary['processed']}")
+    print(f"Successfully found NIFs: {summary['found']}")
+    print(f"NIFs not found on page: {summary['Not found']}")
+    print(f"Pages not found: {summary['Page not found']}")
+    print(f"Failed on errors or blocks (retried on the next refresh): {summary['Error'] + summary['Blocked']}")
+    print(f"Results saved to {OUTPUT_PATH if finished else refreshed_path}")
+    print(f"--- End Summary ---")
+
+def main():
+    """A full run over INPUT_PATH with the settings above; nif_lookup.main does the work"""
+    # Imported here: nif_lookup builds on this module
+    import nif_lookup
+    nif_lookup.main(['--mode', 'direct', '--concurrency', str(CONCURRENCY)]
+                    + (['--fields', *RECORD_FIELDS] if RECORD_FIELDS else []))
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Find NIFs for a list of companies on racius.com")
+    parser.add_argument('--refresh', action='store_true',
+                        help=f'revalidate only failed or stale rows of {OUTPUT_PATH} instead of a full run')
+    parser.add_argument('--max-age', type=float, default=REFRESH_MAX_AGE_DAYS,
+                        help='days after which a found NIF is revalidated in refresh mode')
+    options = parser.parse_args()
+    if options.refresh:
+        refresh(options.max_age)
+    else:
+        main()
\ No newline at end of file
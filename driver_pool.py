@@ -0,0 +1,134 @@
+import logging
+import queue
+import random
+from contextlib import contextmanager
+
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger(__name__)
+
+# Only the HTML is ever read, so everything else a page pulls in is blocked:
+# images, media, fonts, stylesheets, and ad and analytics hosts
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.mp4', '*.webm', '*.mp3', '*.m4a',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.css',
+    '*googletagmanager.com*', '*google-analytics.com*', '*doubleclick.net*',
+    '*googlesyndication.com*', '*adservice.google.*', '*connect.facebook.net*',
+    '*hotjar.com*', '*clarity.ms*',
+]
+
+
+def create_driver(page_load_timeout=30, headless=True):
+    """Start one patched Chrome with a randomized window size.
+
+    The profile is lean: new headless mode unless asked for a window, no
+    images, subresources matching BLOCKED_URL_PATTERNS refused, and page
+    loads that return once the DOM is parsed instead of after every resource.
+    """
+    # Imported here so runs that never need a browser do not need Chrome's driver either
+    import undetected_chromedriver as uc
+
+    options = uc.ChromeOptions()
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--window-size=1920,1080')
+    options.add_argument('--disable-blink-features=AutomationControlled')  # Try to avoid detection
+    options.add_argument('--blink-settings=imagesEnabled=false')
+    options.page_load_strategy = 'eager'
+
+    try:
+        # uc passes --headless=new itself and patches the headless user agent
+        driver = uc.Chrome(options=options, headless=headless)
+        driver.set_page_load_timeout(page_load_timeout)
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+
+        # Add some randomization to the window size
+        width = random.randint(1024, 1920)
+        height = random.randint(768, 1080)
+        driver.set_window_size(width, height)
+    except Exception as e:
+        logger.warning("Error setting up Chrome driver: %s", e)
+        raise
+
+    return driver
+
+
+class PoolSlot:
+    """One pool position and the Chrome currently living in it"""
+
+    def __init__(self, index):
+        self.index = index
+        self.driver = None
+        self.uses = 0
+
+
+class DriverPool:
+    """K warm Chrome instances handed out to workers through a queue.
+
+    Each slot starts its browser on first checkout and keeps it across lookups.
+    A slot is restarted when its browser fails the health check, raises a
+    WebDriver error, or has been checked out max_uses times (one lookup each).
+    Browsers are headless unless a visible window is needed, e.g. for a human
+    to solve CAPTCHAs.
+    """
+
+    def __init__(self, size=3, max_uses=200, page_load_timeout=30, driver_factory=None, headless=True):
+        self.size = size
+        self.headless = headless
+        self.max_uses = max_uses
+        self.page_load_timeout = page_load_timeout
+        self.driver_factory = driver_factory or create_driver
+        self.slots = [PoolSlot(i) for i in range(size)]
+        self.idle = queue.Queue()
+        for slot in self.slots:
+            self.idle.put(slot)
+
+    def _start(self, slot):
+        logger.info("Starting Chrome for pool slot %s", slot.index)
+        slot.driver = self.driver_factory(page_load_timeout=self.page_load_timeout, headless=self.headless)
+        slot.uses = 0
+
+    def _stop(self, slot):
+        if slot.driver is not None:
+            try:
+                slot.driver.quit()
+            except Exception as e:
+                logger.warning("Error closing Chrome in pool slot %s: %s", slot.index, e)
+            slot.driver = None
+
+    def _healthy(self, slot):
+        try:
+            slot.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """Check out a live driver for the duration of the with-block"""
+        slot = self.idle.get(timeout=timeout)
+        crashed = False
+        try:
+            if slot.driver is not None and not self._healthy(slot):
+                logger.warning("Chrome in pool slot %s is unresponsive, restarting", slot.index)
+                self._stop(slot)
+            if slot.driver is None:
+                self._start(slot)
+            yield slot.driver
+        except WebDriverException:
+            crashed = True
+            raise
+        finally:
+            slot.uses += 1
+            if crashed or slot.uses >= self.max_uses:
+                # Restarted lazily on the next checkout
+                self._stop(slot)
+            self.idle.put(slot)
+
+    def close(self):
+        for slot in self.slots:
+            self._stop(slot)
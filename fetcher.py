@@ -0,0 +1,152 @@
+import logging
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import throttle
+from driver_pool import DriverPool
+from page_parser import snapshot, wait_for_content
+
+logger = logging.getLogger(__name__)
+
+PAGE_NOT_FOUND_MARKER = "Página não encontrada"
+
+# Statuses anti-bot layers answer with instead of the page
+BLOCKED_STATUSES = (403, 429, 503)
+
+# Markers of an anti-bot interstitial replacing the real page. A reCAPTCHA
+# widget on an ordinary page (e.g. a contact form) is not one of them.
+CHALLENGE_MARKERS = (
+    "cf-challenge",
+    "cf-browser-verification",
+    "challenge-platform",
+    "checking your browser",
+    "our systems have detected unusual traffic",
+)
+
+DEFAULT_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+        '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    ),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'pt-PT,pt;q=0.9,en;q=0.8',
+}
+
+
+@dataclass
+class FetchResult:
+    """A fetched document and where it came from"""
+    url: str
+    status: int
+    text: str
+    via: str
+    # Validators for a later conditional request, when the server sent them
+    etag: str = None
+    last_modified: str = None
+    # The blocked result a fallback fetcher replaced with this one
+    primary: 'FetchResult' = None
+
+    @property
+    def unchanged(self):
+        """The server answered a conditional request with 304 Not Modified"""
+        return self.status == 304
+
+    @property
+    def blocked(self):
+        if self.status in BLOCKED_STATUSES:
+            return True
+        # Google's CAPTCHA interstitial lives under /sorry/
+        if '/sorry/' in self.url:
+            return True
+        lowered = self.text[:20000].lower()
+        return any(marker in lowered for marker in CHALLENGE_MARKERS)
+
+    @property
+    def not_found(self):
+        return self.status == 404 or PAGE_NOT_FOUND_MARKER in self.text
+
+    @property
+    def outcome(self):
+        """How the request went, for the adaptive throttle"""
+        if self.status == 429:
+            return throttle.THROTTLED
+        if self.blocked:
+            return throttle.BLOCKED if self.status == 403 else throttle.CHALLENGE
+        if self.not_found:
+            return throttle.NOT_FOUND
+        return throttle.OK
+
+
+class HttpFetcher:
+    """Plain HTTP client backed by a pooled keep-alive session"""
+
+    def __init__(self, timeout=15, pool_size=10, headers=None):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+
+    def fetch(self, url, validators=None, cancel=None):
+        """GET url; validators are conditional headers (If-None-Match, If-Modified-Since)"""
+        response = self.session.get(url, timeout=self.timeout, headers=validators)
+        # Without a declared charset requests would either assume ISO-8859-1 or
+        # sniff the whole body to guess one; the pages we read are UTF-8
+        if 'charset' not in response.headers.get('Content-Type', ''):
+            response.encoding = 'utf-8'
+        return FetchResult(url=response.url, status=response.status_code,
+                           text=response.text, via='http',
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'))
+
+    def close(self):
+        self.session.close()
+
+
+class BrowserFetcher:
+    """Fetches pages through a pool of undetected Chrome instances"""
+
+    def __init__(self, pool=None):
+        self.pool = pool or DriverPool(size=1)
+
+    def fetch(self, url, validators=None, cancel=None):
+        # Chrome cannot be asked for a conditional load, so validators are ignored
+        with self.pool.driver() as driver:
+            driver.get(url)
+            wait_for_content(driver)
+            current_url, html = snapshot(driver)
+            # WebDriver does not expose the response status, so report the page as served
+            return FetchResult(url=current_url, status=200, text=html, via='browser')
+
+    def close(self):
+        logger.info("Closing browser pool...")
+        self.pool.close()
+
+
+class FallbackFetcher:
+    """Tries the primary fetcher and only retries through the fallback when blocked"""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def fetch(self, url, validators=None, cancel=None):
+        """The primary's result, or the fallback's if it was blocked and cancel is not set"""
+        result = self.primary.fetch(url, validators)
+        if result.blocked and not (cancel is not None and cancel.is_set()):
+            logger.warning("Blocked over %s (status %s), retrying with %s", result.via, result.status, type(self.fallback).__name__)
+            primary, result = result, self.fallback.fetch(url)
+            result.primary = primary
+        return result
+
+    def close(self):
+        self.primary.close()
+        self.fallback.close()
+
+
+def default_fetcher():
+    """HTTP first, real browser only for URLs that come back blocked"""
+    return FallbackFetcher(HttpFetcher(), BrowserFetcher())
@@ -0,0 +1,121 @@
+import json
+import os
+
+from metrics import METRICS
+
+
+class CheckpointJournal:
+    """Append-only JSONL record of finished companies.
+
+    Each completed company is written as one line as soon as it is done and
+    the file is fsynced every fsync_every rows, so checkpoint cost stays
+    constant per row. Results are recorded in input order, so the journal is
+    always a prefix of the input and a restarted run resumes after its last
+    line without holding earlier results in memory.
+    """
+
+    def __init__(self, path='companies_with_nifs_progress.jsonl', fsync_every=50):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.unsynced = 0
+        self.file = None
+
+    def load(self):
+        """Open the journal for appending and return how many rows it already holds"""
+        rows = 0
+        valid_bytes = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # A crash can leave the last line half-written
+                        break
+                    try:
+                        json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    rows += 1
+                    valid_bytes += len(line)
+            # Drop any torn tail so new lines start on a clean boundary
+            os.truncate(self.path, valid_bytes)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        return rows
+
+    def entries(self, fields=()):
+        """Yield (company_name, nif, *fields) for every recorded row, in input order"""
+        for entry in self.rows():
+            yield (entry['company_name'], entry['nif'], *(entry.get(field) for field in fields))
+
+    def rows(self):
+        """Yield every recorded row as the dict it was written from"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def check(self, company_names, source):
+        """Stop unless the recorded rows are for the first company_names, in order.
+
+        Resuming skips as many input rows as the journal holds, so a journal
+        left by a different or edited input would silently misattribute
+        results.
+        """
+        company_names = iter(company_names)
+        for row_number, row in enumerate(self.rows(), 1):
+            company_name = next(company_names, None)
+            if company_name != row['company_name']:
+                raise SystemExit(
+                    f"{self.path} does not match {source}: row {row_number} is {row['company_name']!r} "
+                    f"in the journal but {company_name!r} in the input; remove the journal to start over"
+                )
+
+    def failed(self, markers):
+        """Company names of the recorded rows whose nif is one of markers, in order"""
+        for row in self.rows():
+            if row['nif'] in markers:
+                yield row['company_name']
+
+    def redo(self, markers, results):
+        """Replace the rows failed(markers) names with results, in the same order.
+
+        results yields (company_name, nif, extra) for each of those rows. The
+        new journal is written next to the old one and swapped in, so an
+        interrupted redo leaves the old journal as it was.
+        """
+        results = iter(results)
+        if self.file is not None:
+            self.close()
+        replacement = self.path + '.redo'
+        with open(replacement, 'w', encoding='utf-8') as f:
+            for row in self.rows():
+                if row['nif'] in markers:
+                    company_name, nif, extra = next(results)
+                    row = {'company_name': company_name, 'nif': nif, **(extra or {})}
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(replacement, self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def record(self, company_name, nif, extra=None):
+        """Append one finished company; extra holds any other extracted fields"""
+        if self.file is None:
+            self.load()
+        with METRICS.timer('checkpoint'):
+            entry = {'company_name': company_name, 'nif': nif, **(extra or {})}
+            self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_every:
+                self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,145 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+DAY = 24 * 60 * 60
+
+
+@dataclass
+class CacheEntry:
+    slug: str
+    url: str
+    nif: str
+    status: int
+    fetched_at: float
+    # Extra company fields found on the page, see company_record
+    record: dict = None
+    # Validators the server sent with the page, for conditional refetches
+    etag: str = None
+    last_modified: str = None
+
+    @property
+    def page_found(self):
+        return self.status == 200
+
+    @property
+    def negative(self):
+        """A missing page, or a page that had no NIF on it"""
+        return not self.page_found or not self.nif
+
+    @property
+    def validators(self):
+        """Conditional request headers that let the server answer 304 if the page is unchanged"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class LookupCache:
+    """On-disk cache of slug lookups against racius.com.
+
+    Rows are keyed by the normalized slug and record the URL that was tried,
+    the NIF found there (if any), any other company fields extracted with it,
+    the HTTP status, its ETag/Last-Modified validators and when it was fetched.
+    Negative results expire after negative_ttl so they get retried sooner.
+    """
+
+    def __init__(self, path='racius_cache.sqlite', ttl=90 * DAY, negative_ttl=7 * DAY):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS lookups ('
+            ' slug TEXT PRIMARY KEY,'
+            ' url TEXT NOT NULL,'
+            ' nif TEXT,'
+            ' status INTEGER NOT NULL,'
+            ' fetched_at REAL NOT NULL,'
+            ' record TEXT,'
+            ' etag TEXT,'
+            ' last_modified TEXT)'
+        )
+        # Caches written by earlier versions lack the newer columns
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(lookups)')}
+        for column in ('record', 'etag', 'last_modified'):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE lookups ADD COLUMN {column} TEXT')
+        self.conn.commit()
+
+    def entry(self, slug):
+        """Return the entry for slug however old it is, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT slug, url, nif, status, fetched_at, record, etag, last_modified'
+                ' FROM lookups WHERE slug = ?',
+                (slug,),
+            ).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(*row[:5], record=json.loads(row[5]) if row[5] else None,
+                          etag=row[6], last_modified=row[7])
+
+    def get(self, slug):
+        """Return the fresh entry for slug, or None if missing or expired"""
+        entry = self.entry(slug)
+        if entry is None:
+            return None
+
+        ttl = self.negative_ttl if entry.negative else self.ttl
+        if time.time() - entry.fetched_at > ttl:
+            return None
+        return entry
+
+    def put(self, slug, url, nif, status, record=None, etag=None, last_modified=None):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO lookups'
+                ' (slug, url, nif, status, fetched_at, record, etag, last_modified)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (slug, url, nif, status, time.time(),
+                 json.dumps(record, ensure_ascii=False) if record is not None else None,
+                 etag, last_modified),
+            )
+            self.conn.commit()
+
+    def touch(self, slug):
+        """Mark slug as checked now, after the server confirmed the page is unchanged"""
+        with self.lock:
+            self.conn.execute('UPDATE lookups SET fetched_at = ? WHERE slug = ?', (time.time(), slug))
+            self.conn.commit()
+
+    def checked_at(self, slugs):
+        """When any of slugs was last fetched or revalidated, or None if never"""
+        times = [entry.fetched_at for entry in map(self.entry, slugs) if entry is not None]
+        return max(times) if times else None
+
+    def resolve(self, slugs):
+        """Answer a lookup from the cache alone.
+
+        Walks the slug variants in the order they would be fetched. Returns the
+        NIF, "Not found" or "Page not found" when every variant needed is
+        cached, or None when at least one has to go to the network.
+        """
+        return self.resolve_entry(slugs)[0]
+
+    def resolve_entry(self, slugs):
+        """Like resolve(), paired with the cached entry of the page that was found, if any"""
+        for slug in slugs:
+            entry = self.get(slug)
+            if entry is None:
+                return None, None
+            if entry.page_found:
+                return entry.nif or "Not found", entry
+        return "Page not found", None
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from regex scans up to blocked-host backoffs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms for one run.
+
+    Stage timings go to the `stage_seconds` histogram, and time spent
+    deliberately waiting on rate limits goes to `sleep_seconds`, so work and
+    politeness can be told apart. Export with write() at the end of a run.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def slept(self, seconds, reason, **labels):
+        if seconds > 0:
+            self.observe('sleep_seconds', seconds, reason=reason, **labels)
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for (name, key), value in sorted(self.counters.items()):
+                lines.append(f'nif_scraper_{name}{_format_labels(key)} {value}')
+            for (name, key), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'nif_scraper_{name}_bucket{_format_labels(key, [("le", le)])} {cumulative}')
+                lines.append(f'nif_scraper_{name}_sum{_format_labels(key)} {histogram.sum}')
+                lines.append(f'nif_scraper_{name}_count{_format_labels(key)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(key), 'value': value}
+                    for (name, key), value in sorted(self.counters.items())
+                ],
+                'histograms': [
+                    {
+                        'name': name,
+                        'labels': dict(key),
+                        'count': histogram.count,
+                        'sum': round(histogram.sum, 6),
+                        'p50': histogram.quantile(0.5),
+                        'p99': histogram.quantile(0.99),
+                    }
+                    for (name, key), histogram in sorted(self.histograms.items())
+                ],
+            }
+
+    def write(self, path):
+        """Prometheus text format for .prom files, a JSON summary otherwise"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith('.prom'):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), f, indent=2)
+
+
+# Shared registry for the whole process
+METRICS = Metrics()
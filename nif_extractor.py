@@ -0,0 +1,111 @@
+import re
+from dataclasses import dataclass
+
+from metrics import METRICS
+
+# (name, regex, confidence) in priority order. Each regex marks the NIF digits
+# with {nif}, which becomes a group named after the pattern.
+NIF_PATTERNS = [
+    ('data_nif', r'data-nif="{nif}"', 0.99),
+    ('class_nif', r'class="nif"[^>]*>{nif}<', 0.98),
+    ('tag_nif', r'>NIF:\s*{nif}<', 0.97),
+    ('tag_contribuinte', r'>Nº Contribuinte:\s*{nif}<', 0.95),
+    ('nif_colon', r'NIF:\s*{nif}', 0.9),
+    ('nif_space', r'NIF\s+{nif}', 0.85),
+    ('contribuinte', r'contribuinte[^>]*>{nif}<', 0.8),
+    # Bounded so a stray "NIF" cannot scan ahead to an unrelated number far away
+    ('nif_loose', r'NIF[^0-9]{{0,100}}{nif}', 0.6),
+]
+
+# Any standalone 9-digit number; only used when asked for
+BARE_PATTERN = ('bare_digits', r'{nif}', 0.3)
+
+# Literal words the labelled patterns are anchored on. A pattern containing
+# one of them cannot match a page without it, so the page is not scanned for it.
+ANCHORS = ('nif', 'NIF', 'ontribuinte')
+
+NIF_DIGITS = r'(?<!\d)(?P<{name}>\d{{9}})(?!\d)'
+
+
+# Weights of the first eight digits, and what their ASCII '0' offsets add up to
+CHECK_WEIGHTS = (9, 8, 7, 6, 5, 4, 3, 2)
+ZERO_OFFSET = ord('0') * sum(CHECK_WEIGHTS)
+
+
+def valid_nif(nif):
+    """Check a 9-digit Portuguese NIF against its mod-11 check digit"""
+    if len(nif) != 9 or not nif.isascii() or not nif.isdigit():
+        return False
+    # Works on the byte values directly; called for every candidate on every page
+    d = nif.encode('ascii')
+    remainder = (9 * d[0] + 8 * d[1] + 7 * d[2] + 6 * d[3] + 5 * d[4] + 4 * d[5] + 3 * d[6] + 2 * d[7]
+                 - ZERO_OFFSET) % 11
+    check = 0 if remainder < 2 else 11 - remainder
+    return check == d[8] - ord('0')
+
+
+@dataclass
+class NifMatch:
+    nif: str
+    pattern: str
+    confidence: float
+
+
+class NifExtractor:
+    """Finds the best NIF on a page, trying the patterns in priority order.
+
+    Each pattern is compiled once and scanned on its own. The first hit that
+    passes the check digit is the answer, so lower-priority patterns only run
+    on pages the better ones found nothing on. A page carrying none of a
+    pattern's ANCHORS is not scanned for that pattern at all.
+    """
+
+    def __init__(self, patterns=NIF_PATTERNS, allow_bare=False):
+        if allow_bare:
+            patterns = list(patterns) + [BARE_PATTERN]
+        self.patterns = [
+            (name, re.compile(regex.format(nif=NIF_DIGITS.format(name=name))), confidence,
+             frozenset(anchor for anchor in ANCHORS if anchor in regex.replace('{nif}', '')))
+            for name, regex, confidence in patterns
+        ]
+
+    def _hits(self, text):
+        """Valid (name, nif, confidence) hits, pattern by pattern in priority order"""
+        rejected = 0
+        # Looked up on first use; finding an anchor stops at its first occurrence
+        present = {}
+        try:
+            for name, regex, confidence, anchors in self.patterns:
+                if anchors:
+                    for anchor in anchors:
+                        if anchor not in present:
+                            present[anchor] = anchor in text
+                        if present[anchor]:
+                            break
+                    else:
+                        continue
+                for match in regex.finditer(text):
+                    nif = match.group(name)
+                    if valid_nif(nif):
+                        yield name, nif, confidence
+                    else:
+                        rejected += 1
+        finally:
+            if rejected:
+                METRICS.inc('nif_check_digit_rejections_total', rejected)
+
+    def candidates(self, text):
+        """All valid candidates, best first"""
+        found = {}
+        for name, nif, confidence in self._hits(text):
+            found.setdefault(nif, NifMatch(nif, name, confidence))
+        return list(found.values())
+
+    def extract(self, text):
+        """The best valid candidate, or None"""
+        hits = self._hits(text)
+        hit = next(hits, None)
+        hits.close()
+        best = NifMatch(hit[1], hit[0], hit[2]) if hit else None
+        METRICS.inc('nif_pattern_hits_total', pattern=best.pattern if best else 'none')
+        return best
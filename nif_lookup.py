@@ -0,0 +1,196 @@
+"""Resolve company names to NIFs, as a library call or from the command line.
+
+    from nif_lookup import lookup_many
+    for company_name, record in lookup_many(names, concurrency=16, cache='racius_cache.sqlite'):
+        print(company_name, record.nif)
+
+    python nif_lookup.py empresas_lda_com_nif.csv -o companies.parquet --mode hybrid --concurrency 8
+    python nif_lookup.py empresas_lda_com_nif.csv -o companies.parquet --fields address cae
+
+Nothing starts Chrome up front: a browser is only launched the first time a
+lookup needs one (a blocked page or a Google search), so runs answered from
+the cache or over plain HTTP never pay for it.
+"""
+import argparse
+import itertools
+import logging
+import os
+from collections import Counter
+
+from company_io import read_companies, open_writer, RESULT_COLUMNS
+from company_record import CompanyRecord, FIELD_PATTERNS, RETRY_MARKERS, result_label
+from crawl import crawl_sync, WINDOW_FACTOR
+from dedup import find_duplicates, Coalescer, KEEP_RECENT
+from direct_scraper import (
+    DirectRaciusScraper, CONCURRENCY, INPUT_PATH, OUTPUT_PATH, CACHE_PATH, JOURNAL_PATH,
+    METRICS_PATH, LOG_LEVEL, PROGRESS_EVERY, SLUG_INDEX_PATH, SITEMAP_DIR,
+)
+from fetcher import FallbackFetcher, HttpFetcher, BrowserFetcher
+from journal import CheckpointJournal
+from lookup_cache import LookupCache
+from metrics import METRICS
+from slug_index import SlugIndex
+from throttle import AdaptiveThrottle
+
+logger = logging.getLogger(__name__)
+
+# direct: racius.com slug URLs only; search: Google only; hybrid: both raced per company
+MODES = ('direct', 'search', 'hybrid')
+
+
+def build_scraper(mode='direct', cache=None, index=None, fields=(), concurrency=CONCURRENCY):
+    """A scraper for mode, with a lookup(company_name) -> (company_name, CompanyRecord)
+
+    concurrency is the number of lookups the caller keeps in flight at once.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}; expected one of {', '.join(MODES)}")
+    if fields and mode != 'direct':
+        raise ValueError("Record fields are only extracted in direct mode")
+
+    if mode == 'direct':
+        scraper = DirectRaciusScraper(cache=cache, index=index, fields=fields)
+        return scraper, scraper.lookup_record
+
+    # The search scraper pulls in Selenium, so it is only imported when asked for
+    from scraper import RaciusScraper, POOL_SIZE
+    from driver_pool import DriverPool
+
+    throttle = AdaptiveThrottle()
+    pool = DriverPool(size=POOL_SIZE)
+    direct = DirectRaciusScraper(
+        fetcher=FallbackFetcher(HttpFetcher(), BrowserFetcher(pool)),
+        throttle=throttle, cache=cache, index=index,
+    )
+    scraper = RaciusScraper(throttle=throttle, pool=pool, direct=direct, direct_access=mode == 'hybrid',
+                            concurrency=concurrency)
+
+    def lookup(company_name):
+        _, nif = scraper.lookup(company_name)
+        return company_name, CompanyRecord(nif)
+
+    return scraper, lookup
+
+
+def lookup_many(names, concurrency=CONCURRENCY, cache=None, mode='direct', fields=(), index=None,
+                dedupe=True, duplicate_counts=None):
+    """Resolve every name, yielding (company_name, CompanyRecord) in input order.
+
+    names is any iterable and is read lazily, a bounded window ahead of the
+    results. cache is a LookupCache or the path of one; a cache passed in is
+    left open for the caller. index is an optional SlugIndex. With dedupe,
+    names sharing a canonical key are looked up once; duplicate_counts from
+    dedup.find_duplicates() lets results be dropped once no longer needed,
+    otherwise only the most recent ones are kept, never fewer than the crawl
+    window holds.
+    """
+    owns_cache = isinstance(cache, str)
+    if owns_cache:
+        cache = LookupCache(cache)
+    scraper, lookup = build_scraper(mode, cache, index, fields, concurrency)
+    if dedupe:
+        keep = max(KEEP_RECENT, concurrency * WINDOW_FACTOR)
+        lookup = Coalescer(lookup, duplicate_counts, keep).lookup
+
+    def results():
+        try:
+            yield from crawl_sync(names, lookup, concurrency)
+        finally:
+            if not owns_cache:
+                # Detach the caller's cache so closing the scraper leaves it open
+                (scraper.direct if mode != 'direct' else scraper).cache = None
+            scraper.close()
+
+    return results()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find NIFs for a list of companies on racius.com")
+    parser.add_argument('input', nargs='?', default=INPUT_PATH,
+                        help='headerless one-column CSV of company names')
+    parser.add_argument('-o', '--output', default=OUTPUT_PATH)
+    parser.add_argument('--format', choices=['csv', 'parquet'],
+                        help='output format; taken from the output extension by default')
+    parser.add_argument('--mode', choices=MODES, default='direct')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='lookups in flight at once')
+    parser.add_argument('--fields', nargs='+', default=[], choices=list(FIELD_PATTERNS),
+                        help='company fields to extract besides the NIF (direct mode)')
+    parser.add_argument('--cache', default=CACHE_PATH, help='SQLite lookup cache')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--index', default=SLUG_INDEX_PATH,
+                        help=f'slug index, built from {SITEMAP_DIR}/ on first use if that exists')
+    parser.add_argument('--journal', default=JOURNAL_PATH, help='checkpoint journal to resume from')
+    parser.add_argument('--no-resume', action='store_true', help='discard the journal and start over')
+    parser.add_argument('--metrics', default=METRICS_PATH, help='.prom for Prometheus text, JSON otherwise')
+    options = parser.parse_args(argv)
+    # Caught here, before the journal and output file are touched
+    if options.fields and options.mode != 'direct':
+        parser.error("--fields is only supported with --mode direct")
+
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    fields = tuple(options.fields)
+
+    if options.no_resume and os.path.exists(options.journal):
+        os.remove(options.journal)
+    journal = CheckpointJournal(options.journal)
+    done = journal.load()
+    if done:
+        logger.info("Resuming: %s companies already in %s", done, options.journal)
+        journal.check(read_companies(options.input), options.input)
+    cache = None if options.no_cache else options.cache
+    index = SlugIndex.load_or_build(options.index, SITEMAP_DIR)
+
+    # Rows an error or a block kept from an answer are looked up again before resuming
+    retry = sum(1 for _ in journal.failed(RETRY_MARKERS))
+    if retry:
+        logger.info("Looking up %s journaled companies again after errors or blocks", retry)
+        redone = lookup_many(journal.failed(RETRY_MARKERS), options.concurrency, cache, options.mode, fields, index)
+        try:
+            journal.redo(RETRY_MARKERS, ((company, record.nif, record.extra()) for company, record in redone))
+        finally:
+            redone.close()
+
+    # Results stream out in input order; earlier runs are replayed from the journal
+    writer = open_writer(options.output, RESULT_COLUMNS + list(fields), options.format)
+    summary = Counter()
+    for company, nif, *extra in journal.entries(fields):
+        writer.write(company, nif, *extra)
+        summary[result_label(nif)] += 1
+    summary['processed'] = done
+
+    duplicates = find_duplicates(itertools.islice(read_companies(options.input), done, None))
+    companies = itertools.islice(read_companies(options.input), done, None)
+
+    results = lookup_many(companies, options.concurrency, cache, options.mode, fields, index,
+                          duplicate_counts=duplicates.counts)
+    try:
+        for company, record in results:
+            nif = record.nif
+            summary['processed'] += 1
+            summary[result_label(nif)] += 1
+            METRICS.inc('companies_total', result=result_label(nif))
+            if summary['processed'] % PROGRESS_EVERY == 0:
+                logger.info("Processed %s companies (%s NIFs found)", summary['processed'], summary['found'])
+            journal.record(company, nif, record.extra())
+            writer.write(company, *record.values(('nif',) + fields))
+    finally:
+        # Shuts the scraper (and any browser it started) down
+        results.close()
+        journal.close()
+        writer.close()
+        METRICS.write(options.metrics)
+
+        print(f"\n--- Scraping Summary ---")
+        print(f"Total companies processed: {summary['processed']}")
+        print(f"Successfully found NIFs: {summary['found']}")
+        print(f"NIFs not found: {summary['Not found']}")
+        print(f"Pages not found: {summary['Page not found']}")
+        print(f"Failed on errors or blocks (retried next run): {summary['Error'] + summary['Blocked']}")
+        print(f"Duplicate rows resolved without a lookup: {duplicates.rows - duplicates.distinct} ({100 * duplicates.ratio:.1f}%)")
+        print(f"Results saved to {options.output}")
+        print(f"Metrics saved to {options.metrics}")
+        print(f"--- End Summary ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from urllib.parse import urlparse, parse_qs
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+from selectolax.parser import HTMLParser
+
+# The final URL and the rendered document in one WebDriver round-trip
+SNAPSHOT_SCRIPT = "return [document.location.href, document.documentElement.outerHTML];"
+
+# True once a company page shows its NIF, or plainly has none to show
+CONTENT_READY_SCRIPT = (
+    "if (document.querySelector('[data-nif], .nif')) return true;"
+    "var text = document.body ? document.body.innerText : '';"
+    "return /NIF|Contribuinte|Página não encontrada/i.test(text);"
+)
+
+
+def snapshot(driver):
+    """(current URL, rendered HTML) of the page loaded in driver"""
+    url, html = driver.execute_script(SNAPSHOT_SCRIPT)
+    return url, html
+
+
+def wait_for_content(driver, timeout=5):
+    """Wait until the element holding the NIF is there, or the page says it has none.
+
+    Pages are loaded eagerly, returning as soon as the DOM is parsed; this
+    only waits longer for pages that fill the NIF in with a script, and gives
+    up quietly so the caller still reads whatever was rendered.
+    """
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+            lambda d: d.execute_script(CONTENT_READY_SCRIPT))
+    except TimeoutException:
+        pass
+
+
+def page_company_name(html):
+    """The company name a company page is about (its first <h1>), or None"""
+    heading = HTMLParser(html).css_first('h1')
+    if heading is None:
+        return None
+    return heading.text(strip=True) or None
+
+
+def _target(href):
+    """Unwrap Google's /url?q=... redirect links"""
+    if href.startswith('/url?'):
+        return parse_qs(urlparse(href).query).get('q', [None])[0]
+    return href
+
+
+def result_links(html, site):
+    """Links to site in a search results page, best first.
+
+    Titled results (an <a> around an <h3>) come before any other link, each
+    group in page order; site-search pages (/q/) are skipped.
+    """
+    titled = []
+    other = []
+    for link in HTMLParser(html).css('a[href]'):
+        href = _target(link.attributes.get('href') or '')
+        if not href or site not in href or '/q/' in href:
+            continue
+        (titled if link.css_first('h3') is not None else other).append(href)
+    return list(dict.fromkeys(titled + other))
@@ -0,0 +1,66 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from metrics import METRICS
+
+# Sustained requests per second and burst size for each host we talk to
+DEFAULT_HOST_RATES = {
+    'www.racius.com': (2.0, 4),
+    'www.google.com': (0.2, 1),
+}
+DEFAULT_RATE = (1.0, 2)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; callers block until a token is theirs"""
+
+    def __init__(self, rate, capacity, jitter=0.25):
+        self.rate = rate
+        self.capacity = capacity
+        self.jitter = jitter
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping if needed. Returns the time spent waiting."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token up front so waiting callers queue up in order
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            # Spread callers out a little so requests do not land on a fixed beat
+            wait += random.uniform(0, self.jitter * wait)
+            time.sleep(wait)
+        return wait
+
+
+class HostRateLimiter:
+    """One token bucket per host, created on first use"""
+
+    def __init__(self, host_rates=None, default_rate=DEFAULT_RATE, jitter=0.25):
+        self.host_rates = dict(DEFAULT_HOST_RATES if host_rates is None else host_rates)
+        self.default_rate = default_rate
+        self.jitter = jitter
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                rate, capacity = self.host_rates.get(host, self.default_rate)
+                self.buckets[host] = TokenBucket(rate, capacity, self.jitter)
+            return self.buckets[host]
+
+    def acquire(self, url):
+        """Wait for permission to request url. Returns the time spent waiting."""
+        host = urlparse(url).netloc
+        waited = self.bucket(host).acquire()
+        METRICS.slept(waited, 'rate_limit', host=host)
+        return waited
@@ -0,0 +1,50 @@
+import logging
+import time
+
+from company_record import CompanyRecord, FAILURE_MARKERS
+from lookup_cache import DAY
+from nif_extractor import valid_nif
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+class Refresher:
+    """Revalidates the rows of an earlier run that need it and passes the rest through.
+
+    A row is looked up again when it has no NIF, its NIF fails the check
+    digit, it lacks a record field now asked for, or its page has not been
+    checked within max_age seconds according to the lookup cache. Those
+    lookups bypass cached answers and use conditional requests, so pages
+    that have not changed cost a 304 and no parsing.
+    """
+
+    def __init__(self, scraper, fields=(), max_age=30 * DAY):
+        self.scraper = scraper
+        self.fields = tuple(fields)
+        self.max_age = max_age
+
+    def reason(self, row):
+        """Why row has to be looked up again, or None if it is still good"""
+        nif = row.get('nif')
+        if not nif or nif in FAILURE_MARKERS:
+            return 'failed'
+        if not valid_nif(nif):
+            return 'invalid'
+        if any(field not in row for field in self.fields):
+            return 'missing_fields'
+        if self.scraper.cache is None:
+            return 'stale'
+        checked = self.scraper.cache.checked_at(self.scraper.candidate_slugs(row['company_name']))
+        if checked is None or time.time() - checked > self.max_age:
+            return 'stale'
+        return None
+
+    def lookup(self, row):
+        """(company_name, CompanyRecord) for one earlier output row"""
+        company_name = row['company_name']
+        reason = self.reason(row)
+        METRICS.inc('refresh_rows_total', reason=reason or 'kept')
+        if reason is None:
+            return company_name, CompanyRecord(row['nif'], **{field: row[field] for field in self.fields})
+        logger.debug("Revalidating %s (%s)", company_name, reason)
+        return self.scraper.lookup_record(company_name, revalidate=True)
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+
+from nif_extractor import valid_nif
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Strategy:
+    """A way of finding a company's NIF.
+
+    fn(company_name, cancel, started) returns a NIF or None, should check the
+    cancel event between its slow steps, and sets the started event once it
+    actually sends a request. A strategy with a start delay only begins once
+    that delay has passed since an undelayed strategy started, or every
+    undelayed strategy has failed.
+    """
+    name: str
+    fn: object
+    delay: float = 0.0
+
+
+@dataclass
+class Resolution:
+    company_name: str
+    nif: str
+    source: str
+    elapsed: float
+
+
+class Resolver:
+    """Races several strategies for one company and keeps the first valid NIF.
+
+    The remaining strategies are told to stop as soon as one succeeds, and the
+    whole race is bounded by a per-company time budget, so a lookup costs the
+    fastest successful source instead of the sum of all of them.
+    """
+
+    def __init__(self, strategies, budget=60.0, max_workers=8):
+        self.strategies = strategies
+        self.budget = budget
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _run(self, strategy, company_name, cancel, hurry, started):
+        if strategy.delay:
+            # Time spent queued in the throttle does not count towards the delay
+            started.wait()
+            hurry.wait(strategy.delay)
+        if cancel.is_set():
+            METRICS.inc('strategy_results_total', strategy=strategy.name, result='skipped')
+            return None
+
+        start = time.perf_counter()
+        result = 'error'
+        try:
+            nif = strategy.fn(company_name, cancel, started)
+            result = 'hit' if nif and valid_nif(nif) else 'miss'
+            return nif
+        finally:
+            METRICS.inc('strategy_results_total', strategy=strategy.name, result=result)
+            METRICS.observe('strategy_seconds', time.perf_counter() - start, strategy=strategy.name, result=result)
+
+    def resolve(self, company_name):
+        """Return a Resolution, with nif None when no strategy found a valid NIF in time"""
+        start = time.monotonic()
+        cancel = threading.Event()
+        # Set when every undelayed strategy has failed, so delayed ones start right away
+        hurry = threading.Event()
+        # Set once an undelayed strategy sends its first request; delays count from there
+        started = threading.Event()
+        futures = {
+            self.executor.submit(self._run, strategy, company_name, cancel, hurry, started): strategy
+            for strategy in self.strategies
+        }
+        undelayed = sum(1 for strategy in self.strategies if not strategy.delay)
+
+        try:
+            for future in as_completed(futures, timeout=self.budget):
+                strategy = futures[future]
+                try:
+                    nif = future.result()
+                except Exception as e:
+                    logger.warning("Strategy %s failed for %s: %s", strategy.name, company_name, e)
+                    nif = None
+
+                if nif and valid_nif(nif):
+                    return Resolution(company_name, nif, strategy.name, time.monotonic() - start)
+
+                if not strategy.delay:
+                    undelayed -= 1
+                    if undelayed == 0:
+                        hurry.set()
+                        started.set()
+        except FutureTimeout:
+            logger.warning("Lookup budget of %ss exhausted for %s", self.budget, company_name)
+        finally:
+            cancel.set()
+            hurry.set()
+            started.set()
+            for future in futures:
+                future.cancel()
+
+        return Resolution(company_name, None, None, time.monotonic() - start)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,307 +1,209 @@
-import os
+import logging
 import time
 import random
-import pandas as pd
-import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import re
-from tqdm import tqdm
-from urllib.parse import quote
-from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import TimeoutException
+from urllib.parse import quote, urlparse
+from throttle import AdaptiveThrottle, CANCELLED
+from driver_pool import DriverPool
+from nif_extractor import NifExtractor
+from resolver import Resolver, Strategy
+from direct_scraper import DirectRaciusScraper
+from fetcher import FallbackFetcher, HttpFetcher, BrowserFetcher, FetchResult
+from page_parser import snapshot, result_links, wait_for_content
+from metrics import METRICS
+import nif_lookup
+
+logger = logging.getLogger(__name__)
+
+# Chrome instances kept warm; only Google searches and blocked pages need one
+POOL_SIZE = 3
+# Lookups kept in flight at once
+CONCURRENCY = 8
+
+# Google is only queried once direct access has failed or is taking this long
+SEARCH_DELAY = 3.0
+# Upper bound on the time spent resolving one company
+LOOKUP_BUDGET = 60.0
+
+# Search results can land on pages without a labelled NIF, so also accept a bare
+# 9-digit number as a last resort; the check digit keeps out phone numbers and the like
+NIF_EXTRACTOR = NifExtractor(allow_bare=True)
 
 class RaciusScraper:
-    def __init__(self):
-        self.base_url = "https://www.racius.com"
-        self.setup_driver()
-        
-    def setup_driver(self):
-        options = uc.ChromeOptions()
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--window-size=1920,1080')
-        options.add_argument('--disable-blink-features=AutomationControlled')  # Try to avoid detection
+    def __init__(self, throttle=None, pool=None, direct=None, wait_for_captcha=False, direct_access=True,
+                 concurrency=CONCURRENCY, base_url="https://www.racius.com", search_url="https://www.google.com/search"):
+        self.base_url = base_url
+        self.search_url = search_url
+        # Search results are filtered to links on this site
+        self.site = urlparse(base_url).netloc.removeprefix('www.')
+        # Politeness towards racius.com and google.com adapts to how each site responds,
+        # and Google is skipped entirely while its circuit breaker is open
+        self.throttle = throttle or AdaptiveThrottle()
+        # Block for a human to solve Google CAPTCHAs instead of giving up on the search
+        self.wait_for_captcha = wait_for_captcha
+        # Warm Chrome instances, one checked out per page load; headless
+        # unless someone has to see the window to solve CAPTCHAs
+        self.pool = pool or DriverPool(size=POOL_SIZE, headless=not wait_for_captcha)
+        # Direct slug URLs (and any cache or slug index) over plain HTTP, sharing
+        # the browser pool for pages that come back blocked
+        self.direct = direct or DirectRaciusScraper(
+            fetcher=FallbackFetcher(HttpFetcher(), BrowserFetcher(self.pool)),
+            throttle=self.throttle,
+            base_url=base_url,
+        )
+        # Direct access and Google search race each other for every company,
+        # unless direct access is turned off and search goes alone
+        if direct_access:
+            strategies = [
+                Strategy('direct', self.direct_strategy),
+                Strategy('search', self.search_strategy, delay=SEARCH_DELAY),
+            ]
+        else:
+            strategies = [Strategy('search', self.search_strategy)]
+        # One thread per strategy of every lookup in flight, so a delayed search
+        # waiting out its head start never holds up another company's lookup
+        self.resolver = Resolver(strategies, budget=LOOKUP_BUDGET, max_workers=concurrency * len(strategies))
         
-        try:
-            self.driver = uc.Chrome(options=options)
-            self.driver.set_page_load_timeout(30)
-            
-            # Add some randomization to the window size
-            width = random.randint(1024, 1920)
-            height = random.randint(768, 1080)
-            self.driver.set_window_size(width, height)
-            
-        except Exception as e:
-            print(f"Error setting up Chrome driver: {str(e)}")
-            raise
-            
     def random_sleep(self, min_time=2, max_time=4):
-        time.sleep(random.uniform(min_time, max_time))
-        
-    def normalize_company_name(self, name):
-        """Convert company name to URL-friendly format"""
-        # Remove common company types
-        name = name.lower()
-        name = name.replace(', lda.', '').replace(' lda', '')
-        name = name.replace(', unipessoal lda.', '').replace(' unipessoal lda', '')
-        
-        # Replace special characters
-        name = name.replace('ç', 'c').replace('ã', 'a').replace('á', 'a').replace('à', 'a')
-        name = name.replace('é', 'e').replace('ê', 'e').replace('í', 'i').replace('ó', 'o')
-        name = name.replace('õ', 'o').replace('ú', 'u').replace('ü', 'u')
-        
-        # Replace spaces and special chars with hyphens
-        name = re.sub(r'[^a-z0-9]+', '-', name)
+        seconds = random.uniform(min_time, max_time)
+        time.sleep(seconds)
+        METRICS.slept(seconds, 'random_sleep')
         
-        # Remove leading/trailing hyphens
-        name = name.strip('-')
+    def get(self, url, company_page=False, cancel=None):
+        """Load url in a pooled browser once the throttle allows it and return it as a FetchResult.
+
+        The browser is only checked out once the throttle slot is granted, the
+        same order the direct lookup's browser fallback takes them in, so a
+        search never holds Chrome while it waits for a slot someone waiting
+        for Chrome holds. Returns None without loading anything if cancel was
+        set while waiting for the slot.
+        """
+        with self.throttle.slot(url) as slot:
+            if cancel is not None and cancel.is_set():
+                slot.record(CANCELLED)
+                return None
+            with self.pool.driver() as driver:
+                with METRICS.timer('page_fetch', via='browser'):
+                    driver.get(url)
+                    if company_page:
+                        wait_for_content(driver)
+                    # URL and document in one round-trip instead of one call for each
+                    current_url, html = snapshot(driver)
+                if not company_page and self.wait_for_captcha and "recaptcha" in html.lower():
+                    # Solved by hand in this same window, so the browser is kept until then
+                    current_url, html = self.solve_captcha(driver) or (current_url, html)
+            page = FetchResult(current_url, 200, html, 'browser')
+            slot.record(page.outcome)
+        return page
         
-        return name
+    def solve_captcha(self, driver):
+        """Wait for a human to solve the CAPTCHA in driver; (url, html) of the results, or None"""
+        logger.warning("*** CAPTCHA detected! ***")
+        logger.warning("Please solve the CAPTCHA in the browser window.")
+        logger.warning("The script will continue automatically after the CAPTCHA is solved.")
+        logger.warning("Waiting for CAPTCHA to be solved...")
         
-    def try_direct_access(self, company_name):
-        """Try to access the company page directly before using Google search"""
+        # Wait for CAPTCHA to be solved (wait for h3 elements to appear)
         try:
-            normalized_name = self.normalize_company_name(company_name)
-            direct_url = f"https://www.racius.com/{normalized_name}/"
-            
-            print(f"Trying direct access: {direct_url}")
-            self.driver.get(direct_url)
+            WebDriverWait(driver, 300).until(  # 5 minute timeout
+                EC.presence_of_element_located((By.TAG_NAME, "h3"))
+            )
+            logger.warning("CAPTCHA solved! Continuing with search...")
             self.random_sleep(2, 3)
-            
-            # Check if we landed on a valid company page
-            if "Página não encontrada" not in self.driver.page_source:
-                print("Direct access successful!")
-                return True
-            
-            print("Direct access failed, falling back to search...")
-            return False
-            
-        except Exception as e:
-            print(f"Error during direct access: {str(e)}")
-            return False
-            
-    def search_company(self, company_name):
-        # First try direct access
-        if self.try_direct_access(company_name):
-            return True
-            
-        # If direct access fails, fall back to Google search
+        except TimeoutException:
+            logger.warning("Timeout waiting for CAPTCHA to be solved")
+            return None
+        return snapshot(driver)
+        
+    def search_company(self, company_name, cancel=None):
+        """Find the company's Racius page through Google and return it, or None"""
         try:
             # Format the Google search query
-            search_query = f"site:racius.com {company_name}"
-            google_url = f"https://www.google.com/search?q={quote(search_query)}"
-            
-            print(f"Falling back to Google search: {search_query}")
-            self.driver.get(google_url)
-            self.random_sleep(3, 5)
-            
-            # Check for CAPTCHA
-            if "recaptcha" in self.driver.page_source.lower():
-                print("\n*** CAPTCHA detected! ***")
-                print("Please solve the CAPTCHA in the browser window.")
-                print("The script will continue automatically after the CAPTCHA is solved.")
-                print("Waiting for CAPTCHA to be solved...")
-                
-                # Wait for CAPTCHA to be solved (wait for h3 elements to appear)
-                try:
-                    WebDriverWait(self.driver, 300).until(  # 5 minute timeout
-                        EC.presence_of_element_located((By.TAG_NAME, "h3"))
-                    )
-                    print("CAPTCHA solved! Continuing with search...")
-                    self.random_sleep(2, 3)
-                except TimeoutException:
-                    print("Timeout waiting for CAPTCHA to be solved")
-                    return False
-            
-            try:
-                # First try to find the main link by h3 title
-                print("Looking for search results...")
-                h3_elements = WebDriverWait(self.driver, 15).until(
-                    EC.presence_of_all_elements_located((By.TAG_NAME, "h3"))
-                )
-                
-                print(f"Found {len(h3_elements)} h3 elements")
-                for h3 in h3_elements:
-                    try:
-                        title_text = h3.text
-                        print(f"Found title: {title_text}")
-                        
-                        # Get the parent <a> tag
-                        parent = h3.find_element(By.XPATH, "./..")
-                        if parent.tag_name != "a":
-                            parent = parent.find_element(By.XPATH, "./..")
-                        
-                        href = parent.get_attribute("href")
-                        print(f"Found link: {href}")
-                        
-                        if href and "racius.com" in href and not "/q/" in href:
-                            print(f"Found valid Racius link: {href}")
-                            # Navigate directly to the URL
-                            self.driver.get(href)
-                            self.random_sleep(2, 3)
-                            return True
-                    except Exception as e:
-                        print(f"Error processing h3: {str(e)}")
-                        continue
-                
-                print("No suitable Racius link found in h3 elements, trying alternative method...")
-                
-                # Fallback: try to find any link to racius.com
-                links = self.driver.find_elements(By.TAG_NAME, "a")
-                for link in links:
-                    try:
-                        href = link.get_attribute("href")
-                        if href and "racius.com" in href and not "/q/" in href:
-                            print(f"Found Racius link (alternative method): {href}")
-                            self.driver.get(href)
-                            self.random_sleep(2, 3)
-                            return True
-                    except:
-                        continue
-                
-                print("No suitable Racius link found")
-                return False
-                
-            except TimeoutException:
-                print("Timeout waiting for search results")
-                return False
-            except Exception as e:
-                print(f"Error finding/clicking link: {str(e)}")
-                return False
+            search_query = f"site:{self.site} {company_name}"
+            google_url = f"{self.search_url}?q={quote(search_query)}"
+            
+            if not self.throttle.allow(google_url):
+                logger.warning("Google circuit breaker is open, skipping search")
+                return None
+            
+            logger.debug("Falling back to Google search: %s", search_query)
+            results = self.get(google_url, cancel=cancel)
+            if results is None or (cancel is not None and cancel.is_set()):
+                return None
+            
+            # Still a CAPTCHA here if nobody is waiting to solve it, or nobody did in time
+            if "recaptcha" in results.text.lower():
+                logger.warning("CAPTCHA detected, skipping search")
+                return None
+            
+            # Titled results first, then any other link to the site, all parsed
+            # out of the one snapshot instead of element by element over WebDriver
+            with METRICS.timer('serp_parse'):
+                links = result_links(results.text, self.site)
+            if not links:
+                logger.debug("No suitable Racius link found")
+                return None
+            
+            logger.debug("Found valid Racius link: %s", links[0])
+            return self.get(links[0], company_page=True, cancel=cancel)
                 
         except Exception as e:
-            print(f"Error searching for company {company_name}: {str(e)}")
-            return False
+            logger.warning("Error searching for company %s: %s", company_name, e)
+            return None
             
-    def extract_nif(self):
-        current_url = self.driver.current_url
-        print(f"Attempting to extract NIF from URL: {current_url}")
+    def extract_nif(self, page):
+        logger.debug("Attempting to extract NIF from URL: %s", page.url)
         try:
-            # Wait for the page to load
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            self.random_sleep(2, 3)
-            
-            # Get the page source
-            page_source = self.driver.page_source
-            print("Got page source, looking for NIF...")
-            
-            # Try to find NIF in the page content with various patterns
-            nif_patterns = [
-                r'NIF:\s*(\d{9})',
-                r'NIF\s+(\d{9})',
-                r'NIF[^0-9]*(\d{9})',
-                r'data-nif="(\d{9})"',
-                r'class="nif"[^>]*>(\d{9})<',
-                r'>NIF:\s*(\d{9})<',
-                r'>Nº Contribuinte:\s*(\d{9})<',
-                r'contribuinte de[^>]*>(\d{9})<',
-                r'\b\d{9}\b'  # Fallback to any 9-digit number if nothing else works
-            ]
-            
-            for pattern in nif_patterns:
-                print(f"Trying pattern: {pattern}")
-                match = re.search(pattern, page_source)
-                if match:
-                    nif = match.group(1)
-                    print(f"Found NIF using pattern '{pattern}': {nif}")
-                    return nif
-            
-            print("No NIF found in page source")
+            # Single pass over the page; candidates failing the check digit are dropped
+            with METRICS.timer('extraction'):
+                match = NIF_EXTRACTOR.extract(page.text)
+            if match:
+                logger.debug("Found NIF using pattern %s: %s", match.pattern, match.nif)
+                return match
+            
+            logger.debug("No NIF found in page source")
             return None
             
         except Exception as e:
-            print(f"Error extracting NIF: {str(e)}")
+            logger.warning("Error extracting NIF: %s", e)
             return None
             
+    def direct_strategy(self, company_name, cancel, started):
+        _, nif = self.direct.lookup(company_name, started, cancel)
+        return nif
+        
+    def search_strategy(self, company_name, cancel, started):
+        if cancel.is_set():
+            return None
+        page = self.search_company(company_name, cancel)
+        if page is None or page.not_found:
+            logger.debug("Company search failed or no results found.")
+            return None
+        if cancel.is_set():
+            return None
+        match = self.extract_nif(page)
+        return match.nif if match else None
+            
+    def lookup(self, company):
+        """Resolve one company to (company, nif or "Not found")"""
+        resolution = self.resolver.resolve(company)
+        if resolution.nif:
+            logger.debug("Successfully extracted NIF: %s (via %s in %.1fs)", resolution.nif, resolution.source, resolution.elapsed)
+            return company, resolution.nif
+        return company, "Not found"
+            
     def close(self):
-        if self.driver:
-            print("Closing the browser...")
-            self.driver.quit()
+        self.resolver.close()
+        self.direct.close()
+        logger.info("Closing the browsers...")
+        self.pool.close()
 
 def main():
-    # Read the CSV file without headers and create a column name
-    df = pd.read_csv('empresas_lda_com_nif.csv', header=None, names=['company_name'])
-    companies = df['company_name'].tolist()
-    
-    # Initialize results dictionary
-    results = {'company_name': [], 'nif': []}
-    
-    # Initialize scraper
-    scraper = RaciusScraper()
-    
-    try:
-        # Process each company
-        for i, company in enumerate(companies, 1):
-            print(f"\nProcessing company {i}/{len(companies)}: {company}")
-            
-            nif_found = False
-            max_retries = 2
-            retry_count = 0
-            
-            while not nif_found and retry_count < max_retries:
-                try:
-                    if scraper.search_company(company):
-                        nif = scraper.extract_nif()
-                        if nif:
-                            print(f"Successfully extracted NIF: {nif}")
-                            results['company_name'].append(company)
-                            results['nif'].append(nif)
-                            nif_found = True
-                            break
-                        else:
-                            print("NIF not found on company page.")
-                    else:
-                        print("Company search failed or no results found.")
-                        
-                    retry_count += 1
-                    if not nif_found and retry_count < max_retries:
-                        print(f"Retrying... Attempt {retry_count + 1}/{max_retries}")
-                        scraper.random_sleep(5, 7)  # Longer delay between retries
-                        
-                except Exception as e:
-                    print(f"Error during attempt {retry_count + 1}: {str(e)}")
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        print(f"Retrying... Attempt {retry_count + 1}/{max_retries}")
-                        scraper.random_sleep(5, 7)
-                    
-            if not nif_found:
-                results['company_name'].append(company)
-                results['nif'].append("Not found")
-                
-            # Save progress every 5 companies
-            if i % 5 == 0:
-                temp_df = pd.DataFrame(results)
-                temp_df.to_csv('companies_with_nifs_progress.csv', index=False)
-                print(f"Progress saved. Processed {i}/{len(companies)} companies")
-            
-            # Random delay between companies
-            scraper.random_sleep(3, 5)
-            
-    finally:
-        # Close the browser
-        scraper.close()
-        
-        # Save final results
-        print("\nSaving final results...")
-        results_df = pd.DataFrame(results)
-        results_df.to_csv('companies_with_nifs.csv', index=False)
-        
-        # Print summary
-        successful_nifs = len([nif for nif in results['nif'] if nif not in ["Not found", "Error"]])
-        not_found_count = len([nif for nif in results['nif'] if nif == "Not found"])
-        
-        print(f"\n--- Scraping Summary ---")
-        print(f"Total companies processed: {len(companies)}")
-        print(f"Successfully found NIFs: {successful_nifs}")
-        print(f"Companies not found or NIF missing: {not_found_count}")
-        print(f"Results saved to companies_with_nifs.csv")
-        print(f"--- End Summary ---")
+    """Direct access raced against Google search over the input file; nif_lookup.main does the work"""
+    nif_lookup.main(['--mode', 'hybrid', '--concurrency', str(CONCURRENCY)])
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
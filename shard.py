@@ -0,0 +1,258 @@
+"""Split a company list into hash shards, scrape them in parallel processes, merge the results.
+
+    python shard.py split --shards 16
+    python shard.py run --workers 4                   # every shard, 4 processes at a time
+    python shard.py run --workers 4 --only 0-7 --nodes 2   # this node's half of a shared directory
+    python shard.py merge
+
+Each shard has its own input file, checkpoint journal, lookup cache and
+metrics in SHARD_DIR, so shards can run on any node that sees that directory
+and a restarted shard resumes from its journal. merge writes OUTPUT_PATH in
+the original input order once every shard is complete.
+"""
+import argparse
+import asyncio
+import csv
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import direct_scraper
+from company_io import read_companies, open_writer, RESULT_COLUMNS
+from company_record import RETRY_MARKERS, result_label
+from crawl import crawl, crawl_sync
+from dedup import find_duplicates, Coalescer
+from journal import CheckpointJournal
+from lookup_cache import LookupCache
+from metrics import METRICS
+from normalization import company_key
+from rate_limiter import DEFAULT_HOST_RATES, DEFAULT_RATE, HostRateLimiter
+from slug_index import SlugIndex
+from throttle import AdaptiveThrottle
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR = 'shards'
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_SHARDS = 16
+
+
+def shard_of(company_name, shards):
+    """Stable shard number for a company; spelling variants of one name land together"""
+    return zlib.crc32(company_key(company_name).encode('ascii')) % shards
+
+
+def shard_path(directory, kind, shard, extension):
+    return os.path.join(directory, f'{kind}-{shard:05d}.{extension}')
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise SystemExit(f"No shards in {directory}; run `python shard.py split` first")
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def split(input_path, directory, shards):
+    """Write each input row, tagged with its row number, to its shard's input file"""
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        raise SystemExit(f"{directory} already holds a split; remove it to split again")
+
+    files = [open(shard_path(directory, 'input', shard, 'csv'), 'w', encoding='utf-8', newline='')
+             for shard in range(shards)]
+    writers = [csv.writer(f) for f in files]
+    rows = [0] * shards
+    try:
+        for row, company in enumerate(read_companies(input_path)):
+            shard = shard_of(company, shards)
+            writers[shard].writerow((row, company))
+            rows[shard] += 1
+    finally:
+        for f in files:
+            f.close()
+
+    # Written last, so a split interrupted half way is not mistaken for a finished one
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'input': input_path, 'shards': shards, 'rows': rows}, f, indent=2)
+    logger.info("Split %s companies from %s into %s shards", sum(rows), input_path, shards)
+    return rows
+
+
+def read_shard(directory, shard):
+    """Yield (row number, company name) for one shard, in input order"""
+    with open(shard_path(directory, 'input', shard, 'csv'), encoding='utf-8', newline='') as f:
+        for row, company in csv.reader(f):
+            yield int(row), company
+
+
+def shard_limiter(share):
+    """Per-host rates scaled down to this worker's share of the overall budget"""
+    rates = {host: (rate * share, max(1, round(burst * share))) for host, (rate, burst) in DEFAULT_HOST_RATES.items()}
+    rate, burst = DEFAULT_RATE
+    return HostRateLimiter(rates, default_rate=(rate * share, max(1, round(burst * share))))
+
+
+async def process_shard(lookup, companies, journal, summary):
+    async for company, record in crawl(companies, lookup, concurrency=direct_scraper.CONCURRENCY):
+        nif = record.nif
+        summary['processed'] += 1
+        summary[result_label(nif)] += 1
+        METRICS.inc('companies_total', result=result_label(nif))
+        journal.record(company, nif, record.extra())
+
+
+def run_shard(directory, shard, share, log_level):
+    """Worker process body: scrape one shard, resuming from its journal"""
+    logging.basicConfig(level=log_level, format=f'%(asctime)s %(levelname)s shard {shard}: %(message)s')
+
+    journal = CheckpointJournal(shard_path(directory, 'progress', shard, 'jsonl'))
+    done = journal.load()
+    summary = Counter(processed=done)
+    if done:
+        logger.info("Resuming shard %s after %s companies", shard, done)
+        journal.check((company for _, company in read_shard(directory, shard)), f"shard {shard}")
+    def companies():
+        return itertools.islice((company for _, company in read_shard(directory, shard)), done, None)
+    # Spelling variants of a name share a shard, so duplicates coalesce within it
+    duplicates = find_duplicates(companies())
+
+    # The slug index is built once by the parent and only read here
+    index = SlugIndex.load(direct_scraper.SLUG_INDEX_PATH) if os.path.exists(direct_scraper.SLUG_INDEX_PATH) else None
+    scraper = direct_scraper.DirectRaciusScraper(
+        throttle=AdaptiveThrottle(limiter=shard_limiter(share)),
+        cache=LookupCache(shard_path(directory, 'racius_cache', shard, 'sqlite')),
+        index=index,
+        fields=direct_scraper.RECORD_FIELDS,
+    )
+    try:
+        # Rows an error or a block kept from an answer are looked up again first
+        retry = sum(1 for _ in journal.failed(RETRY_MARKERS))
+        if retry:
+            logger.info("Looking up %s companies of shard %s again after errors or blocks", retry, shard)
+            redone = crawl_sync(journal.failed(RETRY_MARKERS), scraper.lookup_record, direct_scraper.CONCURRENCY)
+            journal.redo(RETRY_MARKERS, ((company, record.nif, record.extra()) for company, record in redone))
+        lookup = Coalescer(scraper.lookup_record, duplicates.counts).lookup
+        asyncio.run(process_shard(lookup, companies(), journal, summary))
+    finally:
+        scraper.close()
+        journal.close()
+        METRICS.write(shard_path(directory, 'metrics', shard, 'json'))
+    return summary
+
+
+def parse_shards(spec, shards):
+    """Shard numbers from a spec like '0-3,8,10'"""
+    selected = []
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        selected.extend(range(int(first), int(last or first) + 1))
+    for shard in selected:
+        if not 0 <= shard < shards:
+            raise SystemExit(f"Shard {shard} is out of range for {shards} shards")
+    return sorted(set(selected))
+
+
+def run(directory, workers, only=None, nodes=1, log_level='INFO'):
+    """Scrape the selected shards (all by default), `workers` processes at a time"""
+    manifest = load_manifest(directory)
+    selected = parse_shards(only, manifest['shards']) if only else range(manifest['shards'])
+    # Every concurrently running worker, on this node and the others, gets an equal
+    # slice of the per-host rate, so adding workers never exceeds the site's budget
+    share = 1.0 / (min(workers, len(selected)) * nodes)
+
+    # Build the slug index up front instead of once per worker
+    SlugIndex.load_or_build(direct_scraper.SLUG_INDEX_PATH, direct_scraper.SITEMAP_DIR)
+
+    total = Counter()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {executor.submit(run_shard, directory, shard, share, log_level): shard for shard in selected}
+        for future in as_completed(futures):
+            summary = future.result()
+            total.update(summary)
+            logger.info("Shard %s done: %s companies, %s NIFs found", futures[future], summary['processed'], summary['found'])
+    return total
+
+
+def journal_rows(path):
+    journal = CheckpointJournal(path)
+    rows = journal.load()
+    journal.close()
+    return rows
+
+
+def merge(directory, output_path):
+    """Write every shard's results to output_path in input order; all shards must be complete"""
+    manifest = load_manifest(directory)
+    incomplete = [
+        shard for shard, rows in enumerate(manifest['rows'])
+        if journal_rows(shard_path(directory, 'progress', shard, 'jsonl')) < rows
+    ]
+    if incomplete:
+        raise SystemExit(f"Shards not finished yet: {', '.join(map(str, incomplete))}")
+
+    fields = direct_scraper.RECORD_FIELDS
+
+    def results(shard):
+        journal = CheckpointJournal(shard_path(directory, 'progress', shard, 'jsonl'))
+        for (row, company), (_, *values) in zip(read_shard(directory, shard), journal.entries(fields)):
+            yield row, company, *values
+
+    # Each shard is already in input order, so a streaming k-way merge restores the original order
+    writer = open_writer(output_path, RESULT_COLUMNS + list(fields))
+    summary = Counter()
+    try:
+        for _, company, nif, *extra in heapq.merge(*(results(shard) for shard in range(manifest['shards']))):
+            writer.write(company, nif, *extra)
+            summary['processed'] += 1
+            summary[result_label(nif)] += 1
+    finally:
+        writer.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['split', 'run', 'merge', 'all'])
+    parser.add_argument('--input', default=direct_scraper.INPUT_PATH)
+    parser.add_argument('--output', default=direct_scraper.OUTPUT_PATH)
+    parser.add_argument('--dir', default=SHARD_DIR, help='shard directory, shared between nodes')
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS, help='number of shards to split into')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='shard processes to run at once on this node')
+    parser.add_argument('--only', help="shards for this node to run, e.g. '0-7' or '0,2,4'")
+    parser.add_argument('--nodes', type=int, default=1, help='nodes running shards at the same time')
+    options = parser.parse_args()
+
+    log_level = direct_scraper.LOG_LEVEL
+    logging.basicConfig(level=log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    # `all` picks up an earlier split instead of refusing to redo it
+    resuming = options.command == 'all' and os.path.exists(os.path.join(options.dir, MANIFEST_NAME))
+    if options.command == 'split' or (options.command == 'all' and not resuming):
+        split(options.input, options.dir, options.shards)
+    if options.command in ('run', 'all'):
+        total = run(options.dir, options.workers, options.only, options.nodes, log_level)
+        logger.info("Processed %s companies (%s NIFs found)", total['processed'], total['found'])
+    if options.command in ('merge', 'all'):
+        summary = merge(options.dir, options.output)
+        print(f"\n--- Merge Summary ---")
+        print(f"Total companies: {summary['processed']}")
+        print(f"Successfully found NIFs: {summary['found']}")
+        print(f"NIFs not found on page: {summary['Not found']}")
+        print(f"Pages not found: {summary['Page not found']}")
+        print(f"Failed on errors or blocks (rerun `run` to retry): {summary['Error'] + summary['Blocked']}")
+        print(f"Results saved to {options.output}")
+        print(f"--- End Summary ---")
+
+
+if __name__ == "__main__":
+    main()
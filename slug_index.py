@@ -0,0 +1,143 @@
+import logging
+import gzip
+import os
+import pickle
+from array import array
+from collections import Counter
+from urllib.parse import urlparse
+import xml.etree.ElementTree as ET
+
+from normalization import fuzzy_key
+
+logger = logging.getLogger(__name__)
+
+# Top-level paths on racius.com that are not company pages; deeper listing
+# pages (/q/..., /empresas/...) are already excluded by having more than one segment
+NON_COMPANY_PATHS = frozenset({'q', 'pesquisa', 'empresas', 'setores', 'localidades', 'blog'})
+
+NGRAM = 3
+# Only the rarest query n-grams are used to gather candidates
+MAX_QUERY_NGRAMS = 6
+MIN_SIMILARITY = 0.75
+
+
+def ngrams(key):
+    padded = f' {key} '
+    return {padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)}
+
+
+def iter_sitemap_urls(path):
+    """Yield every <loc> in a sitemap file, gzipped or not, without loading it whole"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        for _, element in ET.iterparse(f):
+            if element.tag.endswith('loc') and element.text:
+                yield element.text.strip()
+            element.clear()
+
+
+def company_slug(url):
+    """Slug of a racius.com company URL, or None for other pages"""
+    path = urlparse(url).path.strip('/')
+    if not path or '/' in path or path.endswith('.xml') or path in NON_COMPANY_PATHS:
+        return None
+    return path
+
+
+class SlugIndex:
+    """Offline map from company names to canonical racius.com URLs.
+
+    Built from sitemap files on disk. Lookups try the exact slug, then the
+    fuzzy key, then a trigram search over fuzzy keys restricted to the
+    rarest grams of the query so it stays fast at millions of entries.
+    A trigram match can be a different company with a similar name
+    ('... Silva 1' and '... Silva 11'), so it is reported as such for the
+    caller to check.
+    """
+
+    def __init__(self):
+        self.urls = []
+        self.by_slug = {}
+        self.by_key = {}
+        self.keys = []
+        self.postings = {}
+
+    def add(self, url):
+        slug = company_slug(url)
+        if slug is None or slug in self.by_slug:
+            return
+        entry = len(self.urls)
+        self.urls.append(url)
+        self.by_slug[slug] = entry
+
+        key = fuzzy_key(slug)
+        self.keys.append(key)
+        self.by_key.setdefault(key, entry)
+        for gram in ngrams(key):
+            self.postings.setdefault(gram, array('I')).append(entry)
+
+    @classmethod
+    def from_sitemaps(cls, directory):
+        index = cls()
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(('.xml', '.xml.gz')):
+                for url in iter_sitemap_urls(os.path.join(directory, filename)):
+                    index.add(url)
+        logger.info("Indexed %s company URLs from %s", len(index.urls), directory)
+        return index
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load_or_build(cls, path, sitemap_dir):
+        """Load a saved index, or build one from sitemap_dir and save it; None if neither exists"""
+        if os.path.exists(path):
+            return cls.load(path)
+        if os.path.isdir(sitemap_dir):
+            index = cls.from_sitemaps(sitemap_dir)
+            index.save(path)
+            return index
+        return None
+
+    def _nearest(self, key):
+        grams = ngrams(key)
+        rare = sorted((g for g in grams if g in self.postings), key=lambda g: len(self.postings[g]))
+        rare = rare[:MAX_QUERY_NGRAMS]
+
+        # A close match shares most of the query's rarest grams; only those get scored
+        shared = Counter()
+        for gram in rare:
+            shared.update(self.postings[gram])
+        needed = max(1, int(len(rare) * MIN_SIMILARITY))
+
+        best, best_score = None, MIN_SIMILARITY
+        for entry, count in shared.items():
+            if count < needed:
+                continue
+            other = ngrams(self.keys[entry])
+            score = len(grams & other) / len(grams | other)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def resolve(self, company_name, slugs):
+        """(canonical URL, how it matched: 'exact', 'fuzzy' or 'ngram'), or (None, None)"""
+        for slug in slugs:
+            if slug in self.by_slug:
+                return self.urls[self.by_slug[slug]], 'exact'
+
+        key = fuzzy_key(company_name)
+        if not key:
+            return None, None
+        if key in self.by_key:
+            return self.urls[self.by_key[key]], 'fuzzy'
+
+        entry = self._nearest(key)
+        return (self.urls[entry], 'ngram') if entry is not None else (None, None)
@@ -0,0 +1,14 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from company_record import RecordExtractor  # noqa: E402
+
+
+def test_founded_date_follows_its_label_in_prose_or_in_a_pair():
+    extractor = RecordExtractor(('founded',))
+    assert extractor.extract('<p>Fundada em 12-03-2001</p>') == {'founded': '2001-03-12'}
+    assert extractor.extract('<dt>Data de constituição</dt><dd>12/03/2001</dd>') == {'founded': '2001-03-12'}
+    # Prose that is not followed by the date picks up nothing further down the page
+    assert extractor.extract('<li>Fundada em Lisboa</li><p>12-03-2001</p>') == {}
@@ -0,0 +1,104 @@
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from direct_scraper import DirectRaciusScraper  # noqa: E402
+from fetcher import FetchResult  # noqa: E402
+from rate_limiter import HostRateLimiter  # noqa: E402
+from slug_index import SlugIndex  # noqa: E402
+from throttle import AdaptiveThrottle  # noqa: E402
+
+BASE_URL = 'https://www.racius.com'
+
+# slug -> (company name on its page, NIF)
+COMPANIES = {
+    'transportes-silva-11-lda': ('Transportes Silva 11, Lda', '503004936'),
+    # Slugs do not always spell the whole name
+    'padaria-sao-joao-lda': ('Padaria São João II, Lda', '500000000'),
+}
+
+
+class SiteFetcher:
+    """racius.com as far as the companies above go; any other slug is a 404"""
+
+    def __init__(self):
+        self.fetched = []
+
+    def fetch(self, url, validators=None, cancel=None):
+        slug = url.rstrip('/').rsplit('/', 1)[-1]
+        self.fetched.append(slug)
+        if slug not in COMPANIES:
+            return FetchResult(url, 404, 'Página não encontrada', 'http')
+        name, nif = COMPANIES[slug]
+        return FetchResult(url, 200, f'<h1 class="company-name">{name}</h1><p>NIF: {nif}</p>', 'http')
+
+    def close(self):
+        pass
+
+
+def scraper_with_index():
+    index = SlugIndex()
+    for slug in COMPANIES:
+        index.add(f'{BASE_URL}/{slug}/')
+    throttle = AdaptiveThrottle(limiter=HostRateLimiter({}, default_rate=(1000.0, 1000)))
+    return DirectRaciusScraper(fetcher=SiteFetcher(), throttle=throttle, index=index, base_url=BASE_URL)
+
+
+def test_similar_slug_is_not_taken_for_another_company():
+    scraper = scraper_with_index()
+    # Only 'transportes-silva-11-lda' is close; it is tried, rejected, then the derived slugs 404
+    assert scraper.lookup('Transportes Silva 1, Lda') == ('Transportes Silva 1, Lda', 'Page not found')
+    assert scraper.fetcher.fetched[0] == 'transportes-silva-11-lda'
+    assert 'transportes-silva-1-lda' in scraper.fetcher.fetched
+
+
+def test_similar_slug_is_taken_when_the_page_names_the_company():
+    scraper = scraper_with_index()
+    slugs, unverified = scraper.resolve_slugs('Padaria São João II, Lda')
+    assert unverified == slugs[0] == 'padaria-sao-joao-lda'
+    assert scraper.lookup('Padaria São João II, Lda')[1] == '500000000'
+    assert scraper.fetcher.fetched == ['padaria-sao-joao-lda']
+
+
+class FlakyFetcher(SiteFetcher):
+    """Times out on slugs in `failing`, answers 403 on slugs in `blocked`"""
+
+    def __init__(self, failing=(), blocked=()):
+        super().__init__()
+        self.failing = set(failing)
+        self.blocked = set(blocked)
+
+    def fetch(self, url, validators=None, cancel=None):
+        slug = url.rstrip('/').rsplit('/', 1)[-1]
+        if slug in self.failing:
+            self.fetched.append(slug)
+            raise requests.Timeout(f"Read timed out: {url}")
+        if slug in self.blocked:
+            self.fetched.append(slug)
+            return FetchResult(url, 403, 'Forbidden', 'http')
+        return super().fetch(url, validators, cancel)
+
+
+def scraper_with(fetcher):
+    throttle = AdaptiveThrottle(limiter=HostRateLimiter({}, default_rate=(1000.0, 1000)), base_backoff=0.001)
+    return DirectRaciusScraper(fetcher=fetcher, throttle=throttle, base_url=BASE_URL)
+
+
+def test_error_on_one_variant_still_tries_the_next():
+    scraper = scraper_with(FlakyFetcher(failing={'transportes-silva-11-lda'}))
+    COMPANIES['transportes-silva-11'] = COMPANIES['transportes-silva-11-lda']
+    try:
+        assert scraper.lookup('Transportes Silva 11, Lda')[1] == '503004936'
+    finally:
+        del COMPANIES['transportes-silva-11']
+    assert scraper.fetcher.fetched == ['transportes-silva-11-lda', 'transportes-silva-11']
+
+
+def test_errors_and_blocks_are_not_reported_as_missing_pages():
+    failing = scraper_with(FlakyFetcher(failing={'empresa-lda', 'empresa'}))
+    assert failing.lookup('Empresa, Lda')[1] == 'Error'
+    blocked = scraper_with(FlakyFetcher(blocked={'empresa-lda'}))
+    assert blocked.lookup('Empresa, Lda')[1] == 'Blocked'
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import CheckpointJournal  # noqa: E402
+
+
+def test_resume_stops_on_a_journal_from_other_input(tmp_path):
+    journal = CheckpointJournal(str(tmp_path / 'progress.jsonl'))
+    journal.load()
+    journal.record('Alfa, Lda', '503004936')
+    journal.record('Beta, Lda', 'Not found')
+    journal.close()
+
+    journal.check(['Alfa, Lda', 'Beta, Lda', 'Gama, Lda'], 'input.csv')
+    # A row inserted before the resume point shifts everything after it
+    with pytest.raises(SystemExit, match="row 2 is 'Beta, Lda' in the journal but 'Delta, Lda'"):
+        journal.check(['Alfa, Lda', 'Delta, Lda', 'Beta, Lda'], 'input.csv')
+    # Fewer input rows than the journal holds
+    with pytest.raises(SystemExit, match="but None in the input"):
+        journal.check(['Alfa, Lda'], 'input.csv')
@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper  # noqa: E402
+from direct_scraper import DirectRaciusScraper  # noqa: E402
+from driver_pool import DriverPool  # noqa: E402
+from fetcher import FallbackFetcher, BrowserFetcher, FetchResult  # noqa: E402
+from page_parser import SNAPSHOT_SCRIPT  # noqa: E402
+from rate_limiter import HostRateLimiter  # noqa: E402
+from throttle import AdaptiveThrottle  # noqa: E402
+
+BASE_URL = 'https://www.racius.com'
+SEARCH_URL = 'https://www.google.com/search'
+NIF = '503004936'
+
+
+class FakeDriver:
+    """Serves Google results linking to the company page, and company pages showing NIF"""
+
+    def __init__(self, page_load_timeout=30, headless=True):
+        self.current_url = 'about:blank'
+
+    def get(self, url):
+        time.sleep(0.01)
+        self.current_url = url
+
+    def execute_script(self, script):
+        if script != SNAPSHOT_SCRIPT:
+            return True
+        if self.current_url.startswith(SEARCH_URL):
+            return [self.current_url, f'<a href="{BASE_URL}/empresa-lda/"><h3>Empresa</h3></a>']
+        return [self.current_url, f'<p>NIF: {NIF}</p>']
+
+    def quit(self):
+        pass
+
+
+class ForbiddenFetcher:
+    """Plain HTTP that is always blocked, so every direct lookup needs a browser"""
+
+    def fetch(self, url, validators=None, cancel=None):
+        return FetchResult(url, 403, 'Forbidden', 'http')
+
+    def close(self):
+        pass
+
+
+def test_hybrid_lookups_share_one_browser_without_deadlock(monkeypatch):
+    monkeypatch.setattr(scraper, 'SEARCH_DELAY', 0.0)
+    monkeypatch.setattr(scraper, 'LOOKUP_BUDGET', 10.0)
+    # Blocking drives racius.com's AIMD limit down to a single slot
+    throttle = AdaptiveThrottle(limiter=HostRateLimiter({}, default_rate=(1000.0, 1000)),
+                                initial=1, maximum=1, base_backoff=0.001, max_backoff=0.001)
+    pool = DriverPool(size=1, driver_factory=FakeDriver)
+    direct = DirectRaciusScraper(fetcher=FallbackFetcher(ForbiddenFetcher(), BrowserFetcher(pool)),
+                                 throttle=throttle, base_url=BASE_URL)
+    racius = scraper.RaciusScraper(throttle=throttle, pool=pool, direct=direct, concurrency=4,
+                                   base_url=BASE_URL, search_url=SEARCH_URL)
+    companies = [f'Empresa {i} Lda' for i in range(12)]
+    executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        results = list(executor.map(racius.lookup, companies, timeout=30))
+    finally:
+        # Not waited for: after a deadlock the workers never come back
+        executor.shutdown(wait=False, cancel_futures=True)
+    # Losing strategies may still be finishing; once they have, nothing is held
+    racius.resolver.executor.shutdown(wait=True)
+    racius.close()
+
+    assert results == [(company, NIF) for company in companies]
+    assert pool.idle.qsize() == pool.size
+    assert throttle.controller('www.racius.com').in_flight == 0
+
+
+def test_search_loads_no_page_once_cancelled():
+    throttle = AdaptiveThrottle(limiter=HostRateLimiter({}, default_rate=(1000.0, 1000)))
+    pool = DriverPool(size=1, driver_factory=FakeDriver)
+    racius = scraper.RaciusScraper(throttle=throttle, pool=pool, direct_access=False,
+                                   base_url=BASE_URL, search_url=SEARCH_URL)
+
+    class Cancelled:
+        def is_set(self):
+            return True
+
+    try:
+        assert racius.get(f"{SEARCH_URL}?q={quote('x')}", cancel=Cancelled()) is None
+        # The browser was never started
+        assert all(slot.driver is None for slot in pool.slots)
+    finally:
+        racius.close()
+
+
+def test_direct_lookup_stops_once_cancelled():
+    throttle = AdaptiveThrottle(limiter=HostRateLimiter({}, default_rate=(1000.0, 1000)))
+    pool = DriverPool(size=1, driver_factory=FakeDriver)
+    fetched = []
+
+    class CountingFetcher(ForbiddenFetcher):
+        def fetch(self, url, validators=None, cancel=None):
+            fetched.append(url)
+            # Search wins the race while this request is out
+            cancel_event.set()
+            return super().fetch(url, validators)
+
+    cancel_event = threading.Event()
+    direct = DirectRaciusScraper(fetcher=FallbackFetcher(CountingFetcher(), BrowserFetcher(pool)),
+                                 throttle=throttle, base_url=BASE_URL)
+    try:
+        # Several slug variants, but neither the next variant nor the browser is tried
+        assert direct.lookup('Empresa Exemplo, Lda', cancel=cancel_event)[1] == 'Blocked'
+        assert len(fetched) == 1
+        assert all(slot.driver is None for slot in pool.slots)
+    finally:
+        direct.close()
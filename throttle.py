@@ -0,0 +1,184 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from rate_limiter import HostRateLimiter
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Outcomes a request can be recorded with
+OK = 'ok'
+NOT_FOUND = 'not_found'
+BLOCKED = 'blocked'
+THROTTLED = 'throttled'
+CHALLENGE = 'challenge'
+ERROR = 'error'
+# The slot was granted but the caller no longer needed the request
+CANCELLED = 'cancelled'
+
+# Outcomes that mean the site wants us to slow down
+BACKOFF_OUTCOMES = {BLOCKED, THROTTLED, CHALLENGE}
+
+
+class HostController:
+    """AIMD concurrency limit for one host.
+
+    Every healthy response grows the limit by about one slot per window of
+    `limit` responses; a 403/429/challenge halves it and pauses the host for an
+    exponentially growing, jittered backoff. Responses much slower than the
+    running average shrink the limit gently without pausing.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=16, base_backoff=5.0, max_backoff=600.0,
+                 decrease=0.5, slow_factor=3.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.decrease = decrease
+        self.slow_factor = slow_factor
+        self.in_flight = 0
+        self.strikes = 0
+        self.resume_at = 0.0
+        self.latency = None
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Block until this host has a free slot and is not backing off"""
+        with self.condition:
+            while True:
+                pause = self.resume_at - time.monotonic()
+                if pause <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self.condition.wait(timeout=pause if pause > 0 else None)
+
+    def release(self, outcome, latency):
+        with self.condition:
+            self.in_flight -= 1
+            if outcome in BACKOFF_OUTCOMES:
+                self.strikes += 1
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.strikes - 1))
+                backoff *= random.uniform(0.5, 1.5)
+                self.resume_at = max(self.resume_at, time.monotonic() + backoff)
+                logger.warning("Backing off for %.1fs after %s (limit now %s)", backoff, outcome, int(self.limit))
+            elif outcome in (OK, NOT_FOUND):
+                self.strikes = 0
+                if self.latency is not None and latency > self.slow_factor * self.latency:
+                    self.limit = max(self.minimum, self.limit * 0.9)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.condition.notify_all()
+
+
+class CircuitBreaker:
+    """Stops calls to a fallback after repeated blocks, probing again later.
+
+    Opens after `threshold` consecutive backoff outcomes. While open, allow()
+    is False until reset_timeout has passed; then one probe goes through and
+    either closes the breaker or reopens it for twice as long.
+    """
+
+    def __init__(self, threshold=3, reset_timeout=300.0, max_timeout=3600.0):
+        self.threshold = threshold
+        self.base_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_timeout = max_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.probing = True
+            return True
+
+    def record(self, outcome):
+        with self.lock:
+            if outcome in BACKOFF_OUTCOMES:
+                self.failures += 1
+                if self.probing:
+                    self.reset_timeout = min(self.max_timeout, self.reset_timeout * 2)
+                if self.probing or self.failures >= self.threshold:
+                    if self.opened_at is None or self.probing:
+                        logger.warning("Circuit open for %.0fs after %s blocked requests", self.reset_timeout, self.failures)
+                    self.opened_at = time.monotonic()
+                self.probing = False
+            elif outcome in (ERROR, CANCELLED):
+                # An inconclusive probe; let the next caller try again
+                self.probing = False
+            else:
+                self.failures = 0
+                self.opened_at = None
+                self.probing = False
+                self.reset_timeout = self.base_timeout
+
+
+class RequestSlot:
+    """Handed to the caller for the duration of one request"""
+
+    def __init__(self):
+        self.outcome = None
+
+    def record(self, outcome):
+        self.outcome = outcome
+
+
+class AdaptiveThrottle:
+    """Per-host politeness: a token-bucket rate ceiling, an AIMD concurrency
+    limit and, for fallback hosts such as Google, a circuit breaker."""
+
+    def __init__(self, limiter=None, breaker_hosts=('www.google.com',), **controller_options):
+        self.limiter = limiter or HostRateLimiter()
+        self.controller_options = controller_options
+        self.controllers = {}
+        self.breakers = {host: CircuitBreaker() for host in breaker_hosts}
+        self.lock = threading.Lock()
+
+    def controller(self, host):
+        with self.lock:
+            if host not in self.controllers:
+                self.controllers[host] = HostController(**self.controller_options)
+            return self.controllers[host]
+
+    def allow(self, url):
+        """False while the host's circuit breaker is open"""
+        breaker = self.breakers.get(urlparse(url).netloc)
+        return breaker is None or breaker.allow()
+
+    @contextmanager
+    def slot(self, url):
+        """Wait for permission to request url; record the outcome on the yielded slot"""
+        host = urlparse(url).netloc
+        controller = self.controller(host)
+        waiting = time.monotonic()
+        controller.acquire()
+        METRICS.slept(time.monotonic() - waiting, 'throttle', host=host)
+        self.limiter.acquire(url)
+        slot = RequestSlot()
+        start = time.monotonic()
+        try:
+            yield slot
+        except Exception:
+            if slot.outcome is None:
+                slot.outcome = ERROR
+            raise
+        finally:
+            outcome = slot.outcome or OK
+            METRICS.inc('requests_total', host=host, outcome=outcome)
+            controller.release(outcome, time.monotonic() - start)
+            breaker = self.breakers.get(host)
+            if breaker is not None:
+                breaker.record(outcome)